@@ -0,0 +1,98 @@
+"""
+Бенчмарк выборки контекста чата для пользователя с большой историей.
+
+Сравнивается старый подход (полная выборка без индекса, оценка токенов
+на каждый вызов и сборка списка через insert(0, ...)) и текущий
+DatabaseManager.get_chat_context.
+
+Запуск: python benchmarks/chat_context.py [--rows N] [--runs N]
+"""
+import argparse
+import atexit
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+TMP_DIR = tempfile.mkdtemp(prefix="pollibot_bench_")
+atexit.register(shutil.rmtree, TMP_DIR, ignore_errors=True)
+os.environ["DATABASE_FILE"] = os.path.join(TMP_DIR, "after.db")
+
+from src.managers.database import db  # noqa: E402
+
+HEAVY_USER_ID = 1
+OTHER_USERS = 50
+
+def fill_history(conn: sqlite3.Connection, rows: int) -> None:
+    """Заполнение истории: один тяжелый пользователь и немного соседей."""
+    def generate():
+        for i in range(rows):
+            role = "user" if i % 2 == 0 else "assistant"
+            yield HEAVY_USER_ID, f"Сообщение номер {i}: " + "текст " * 20, role, f"2024-01-01 00:{i // 60 % 60:02d}:{i % 60:02d}"
+            if i % 10 == 0:
+                yield 2 + i % OTHER_USERS, "Чужое сообщение", role, "2024-01-01 00:00:00"
+    conn.executemany(
+        "INSERT INTO chat_history (user_id, message, role, timestamp) VALUES (?, ?, ?, ?)",
+        generate()
+    )
+    conn.commit()
+
+def legacy_get_chat_context(conn: sqlite3.Connection, user_id: int, max_tokens: int = 2000) -> list:
+    """Старая реализация: полная выборка и квадратичная сборка списка."""
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT message, role
+        FROM chat_history
+        WHERE user_id = ?
+        ORDER BY timestamp DESC
+    """, (user_id,))
+    messages = []
+    total_tokens = 0
+    for row in cursor.fetchall():
+        message_tokens = len(row[0]) // 4
+        if total_tokens + message_tokens > max_tokens:
+            break
+        messages.insert(0, {"role": row[1], "content": row[0]})
+        total_tokens += message_tokens
+    return messages
+
+def measure(func, runs: int) -> float:
+    """Среднее время одного вызова в миллисекундах."""
+    started = time.perf_counter()
+    for _ in range(runs):
+        func()
+    return (time.perf_counter() - started) / runs * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    legacy_conn = sqlite3.connect(os.path.join(TMP_DIR, "before.db"))
+    legacy_conn.execute("""
+        CREATE TABLE chat_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, message TEXT,
+            role TEXT, timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    fill_history(legacy_conn, args.rows)
+    with db._cursor() as cursor:
+        fill_history(cursor.connection, args.rows)
+        # Строки вставлены без token_count, заполняем их миграцией
+        db._migrate_chat_history(cursor)
+
+    before = measure(lambda: legacy_get_chat_context(legacy_conn, HEAVY_USER_ID), args.runs)
+    after = measure(lambda: db.get_chat_context(HEAVY_USER_ID), args.runs)
+    print(f"История: {args.rows} сообщений")
+    print(f"Без индекса, полная выборка: {before:9.2f} мс/вызов")
+    print(f"Накопленная сумма токенов:   {after:9.2f} мс/вызов")
+    print(f"Ускорение: x{before / after:.1f}")
+    legacy_conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Бенчмарк обработки апдейтов на уровне базы данных.
+
+Один "апдейт" - это цикл, который выполняет обработчик генерации:
+get_user_stats -> увеличение счетчика -> get_user_stats (отрисовка меню).
+В обоих вариантах счетчик записывается в базу сразу, без буфера
+usage_counter, поэтому сравнивается одинаковая работа.
+Сравнивается старый подход (новое соединение на каждый вызов) и
+постоянное соединение DatabaseManager с WAL и настроенными PRAGMA.
+
+Запуск: python benchmarks/db_updates.py [--updates N] [--users N]
+"""
+import argparse
+import atexit
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+TMP_DIR = tempfile.mkdtemp(prefix="pollibot_bench_")
+atexit.register(shutil.rmtree, TMP_DIR, ignore_errors=True)
+os.environ["DATABASE_FILE"] = os.path.join(TMP_DIR, "after.db")
+
+from src.managers.database import db  # noqa: E402
+
+def legacy_get_user_stats(db_file: str, user_id: int) -> dict:
+    """Чтение статистики с открытием нового соединения, как раньше."""
+    with sqlite3.connect(db_file) as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM users WHERE user_id = ?", (user_id,))
+        user = cursor.fetchone()
+        if not user:
+            cursor.execute(
+                "INSERT INTO users (user_id, images_generated, texts_generated, audio_generated) VALUES (?, 0, 0, 0)",
+                (user_id,)
+            )
+            conn.commit()
+            return {"images_generated": 0, "texts_generated": 0, "audio_generated": 0}
+        cursor.execute("SELECT model_type, models FROM user_models WHERE user_id = ?", (user_id,))
+        cursor.fetchall()
+        return {"images_generated": user[1], "texts_generated": user[2], "audio_generated": user[3]}
+
+def legacy_update_user_stats(db_file: str, user_id: int, stats: dict) -> None:
+    """Запись статистики с открытием нового соединения, как раньше."""
+    with sqlite3.connect(db_file) as conn:
+        conn.execute(
+            "UPDATE users SET images_generated = ?, texts_generated = ?, audio_generated = ?, last_used = ? WHERE user_id = ?",
+            (stats["images_generated"], stats["texts_generated"], stats["audio_generated"], stats.get("last_used"), user_id)
+        )
+        conn.commit()
+
+def bench_legacy(updates: int, users: int) -> float:
+    db_file = os.path.join(TMP_DIR, "before.db")
+    with sqlite3.connect(db_file) as conn:
+        conn.execute("""
+            CREATE TABLE users (
+                user_id INTEGER PRIMARY KEY, images_generated INTEGER DEFAULT 0,
+                texts_generated INTEGER DEFAULT 0, audio_generated INTEGER DEFAULT 0,
+                last_used TIMESTAMP, current_model TEXT, model_type TEXT, current_voice TEXT
+            )
+        """)
+        conn.execute("CREATE TABLE user_models (user_id INTEGER, model_type TEXT, models TEXT, PRIMARY KEY (user_id, model_type))")
+
+    started = time.perf_counter()
+    for i in range(updates):
+        user_id = i % users
+        stats = legacy_get_user_stats(db_file, user_id)
+        stats["images_generated"] += 1
+        stats["last_used"] = datetime.now()
+        legacy_update_user_stats(db_file, user_id, stats)
+        legacy_get_user_stats(db_file, user_id)
+    return updates / (time.perf_counter() - started)
+
+def bench_current(updates: int, users: int) -> float:
+    started = time.perf_counter()
+    for i in range(updates):
+        user_id = i % users
+        db.get_user_stats(user_id)
+        db.increment_usage({user_id: {"images_generated": 1, "last_used": datetime.now()}})
+        db.get_user_stats(user_id)
+    return updates / (time.perf_counter() - started)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--updates", type=int, default=5000)
+    parser.add_argument("--users", type=int, default=100)
+    args = parser.parse_args()
+
+    before = bench_legacy(args.updates, args.users)
+    after = bench_current(args.updates, args.users)
+    print(f"Соединение на каждый вызов: {before:10.1f} апдейтов/с")
+    print(f"Постоянное соединение (WAL): {after:10.1f} апдейтов/с")
+    print(f"Ускорение: x{after / before:.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Нагрузочный тест режима с несколькими рабочими процессами.
+
+Приемник распределяет синтетические обновления по рабочим процессам
+так же, как в режиме WORKERS > 1. Обработчик имитирует работу, которая
+упирается в GIL: кодирование изображения в base64 и разбор большого
+JSON ответа. Пропускная способность измеряется для разного числа
+процессов; на машине с достаточным количеством ядер она растет почти
+линейно. Запросы к Telegram и Pollinations не отправляются.
+
+Запуск: python benchmarks/worker_scaling.py [--updates N] [--users N] [--workers 1 2 4]
+"""
+import argparse
+import asyncio
+import atexit
+import base64
+import functools
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+TMP_DIR = tempfile.mkdtemp(prefix="pollibot_bench_")
+atexit.register(shutil.rmtree, TMP_DIR, ignore_errors=True)
+os.environ.setdefault("DATABASE_FILE", os.path.join(TMP_DIR, "bot.db"))
+os.environ.setdefault("MEDIA_CACHE_DIR", os.path.join(TMP_DIR, "media"))
+
+from aiogram import Bot, Dispatcher, types  # noqa: E402
+from aiogram.types import Update  # noqa: E402
+
+from src.server.workers import UpdateDistributor, run_worker, start_workers, stop_workers  # noqa: E402
+
+# Токен правильного формата; запросы к Telegram в тесте не выполняются
+FAKE_TOKEN = "123456:bench"
+IMAGE = os.urandom(256 * 1024)
+RESPONSE = json.dumps({"choices": [{"message": {"content": "x" * 64}}] * 2000})
+
+async def handle_message(message: types.Message) -> None:
+    base64.b64encode(IMAGE)
+    json.loads(RESPONSE)
+
+def bench_worker(ready, index: int, count: int, updates) -> None:
+    dispatcher = Dispatcher()
+    dispatcher.message.register(handle_message)
+    ready.put(index)
+    asyncio.run(run_worker(dispatcher, Bot(FAKE_TOKEN), updates, index, count))
+
+def make_update(update_id: int, user_id: int) -> Update:
+    return Update.model_validate({
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "bench"},
+            "text": "нарисуй кота"
+        }
+    })
+
+async def bench(workers: int, updates: int, users: int) -> float:
+    ready = multiprocessing.get_context("spawn").Queue()
+    processes, queues = start_workers(functools.partial(bench_worker, ready), workers)
+    loop = asyncio.get_running_loop()
+    for _ in range(workers):
+        await loop.run_in_executor(None, ready.get)
+
+    distributor = UpdateDistributor(None, queues)
+    batch = [make_update(i, i % users) for i in range(updates)]
+    started = time.perf_counter()
+    for update in batch:
+        distributor.submit(update)
+    await stop_workers(processes, queues)
+    return updates / (time.perf_counter() - started)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    args = parser.parse_args()
+
+    print(f"Ядер CPU: {os.cpu_count()}")
+    baseline = None
+    for workers in args.workers:
+        rate = asyncio.run(bench(workers, args.updates, args.users))
+        baseline = baseline or rate
+        print(f"Процессов: {workers:2d}  {rate:10.1f} обновлений/с  x{rate / baseline:.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,19 @@
 import asyncio
 import logging
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.client.default import DefaultBotProperties
 
-from config.config import BOT_TOKEN
+from config.config import BOT_TOKEN, BOT_MODE, SERVER_HOST, MONITORING_PORT, WORKERS
 from src.handlers.commands import register_all_handlers
+from src.managers.http_client import http_client
+from src.managers.async_database import async_db
+from src.managers.usage_counter import usage_counter
+from src.managers.model_catalog import model_catalog
+from src.managers.fsm_storage import SQLiteStorage
+from src.managers.media_cache import media_cache
+from src.managers.telegram_rate_limiter import telegram_rate_limiter
+from src.server.webhook import run_webhook, create_app, serve
+from src.server.workers import run_ingress, run_worker
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
@@ -15,14 +23,61 @@ bot = Bot(
     token=BOT_TOKEN, 
     default=DefaultBotProperties(parse_mode='HTML')
 )
-storage = MemoryStorage()
+# Все исходящие запросы к Telegram проходят через ограничитель отправки
+bot.session.middleware(telegram_rate_limiter)
+# Состояния FSM хранятся в базе данных и переживают перезапуск
+storage = SQLiteStorage()
 dp = Dispatcher(storage=storage)
 
 # Регистрация всех обработчиков
 register_all_handlers(dp)
 
+async def on_startup():
+    # Открываем общий пул соединений к Pollinations API
+    await http_client.start()
+    # Запускаем периодическую запись счетчиков использования
+    usage_counter.start()
+    # Загружаем и прогреваем каталог моделей, дальше он обновляется в фоне
+    await model_catalog.start()
+    # Запускаем удаление устаревших состояний FSM
+    storage.start()
+
+async def on_shutdown():
+    # Закрываем пул соединений, сбрасываем счетчики и закрываем базу
+    await model_catalog.stop()
+    await http_client.close()
+    await usage_counter.stop()
+    await storage.close()
+    await async_db.close()
+
+dp.startup.register(on_startup)
+dp.shutdown.register(on_shutdown)
+
+def worker_process(index: int, count: int, updates) -> None:
+    """Точка входа рабочего процесса в режиме WORKERS > 1."""
+    asyncio.run(run_worker(dp, bot, updates, index, count))
+
 async def main():
-    await dp.start_polling(bot)
+    # Кэши рабочих процессов от прошлых запусков с большим WORKERS (или в режиме
+    # без рабочих процессов - все) больше не используются
+    media_cache.remove_stale_partitions(WORKERS if WORKERS > 1 else 0)
+
+    if WORKERS > 1:
+        # Этот процесс только принимает обновления, обработчики работают в рабочих процессах
+        await run_ingress(dp, bot, worker_process, WORKERS)
+        return
+
+    if BOT_MODE == "webhook":
+        await run_webhook(dp, bot)
+        return
+
+    # В режиме polling /health и /metrics доступны, если задан MONITORING_PORT
+    runner = await serve(create_app(), SERVER_HOST, MONITORING_PORT) if MONITORING_PORT else None
+    try:
+        await dp.start_polling(bot)
+    finally:
+        if runner is not None:
+            await runner.cleanup()
 
 if __name__ == "__main__":
     asyncio.run(main()) 
\ No newline at end of file
@@ -11,6 +11,134 @@ IMAGE_MODELS_URL = "https://image.pollinations.ai/models"
 TEXT_GENERATION_OPENAI_URL = "https://text.pollinations.ai/openai"
 IMAGE_GENERATION_BASE_URL = "https://image.pollinations.ai/prompt/"
 
+# Настройки базы данных SQLite
+DATABASE_FILE = os.getenv("DATABASE_FILE", "data/bot_data.db")
+DB_CACHE_SIZE_KB = int(os.getenv("DB_CACHE_SIZE_KB", "65536"))
+DB_MMAP_SIZE = int(os.getenv("DB_MMAP_SIZE", str(256 * 1024 * 1024)))
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+
+# Кэш профилей пользователей
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "300"))
+
+# Время, после которого каталог моделей обновляется в фоне (с)
+MODEL_CATALOG_TTL = float(os.getenv("MODEL_CATALOG_TTL", "3600"))
+# Плановое обновление каталога: период (с), разброс (доля периода),
+# повтор после неудачи (с) и ожидание первой загрузки при старте (с)
+MODEL_CATALOG_REFRESH_INTERVAL = float(os.getenv("MODEL_CATALOG_REFRESH_INTERVAL", "1800"))
+MODEL_CATALOG_REFRESH_JITTER = float(os.getenv("MODEL_CATALOG_REFRESH_JITTER", "0.1"))
+MODEL_CATALOG_RETRY_INTERVAL = float(os.getenv("MODEL_CATALOG_RETRY_INTERVAL", "60"))
+MODEL_CATALOG_WARMUP_TIMEOUT = float(os.getenv("MODEL_CATALOG_WARMUP_TIMEOUT", "15"))
+
+# Период сброса накопленных счетчиков использования в базу (мс)
+USAGE_FLUSH_INTERVAL_MS = int(os.getenv("USAGE_FLUSH_INTERVAL_MS", "500"))
+
+# Кодировка tiktoken для точного подсчета токенов (пусто - примерная оценка)
+TOKENIZER_ENCODING = os.getenv("TOKENIZER_ENCODING", "")
+
+# Ограничения одновременных запросов к Pollinations API: по типу запроса
+# и на одного пользователя
+UPSTREAM_TEXT_CONCURRENCY = int(os.getenv("UPSTREAM_TEXT_CONCURRENCY", "16"))
+UPSTREAM_IMAGE_CONCURRENCY = int(os.getenv("UPSTREAM_IMAGE_CONCURRENCY", "8"))
+UPSTREAM_AUDIO_CONCURRENCY = int(os.getenv("UPSTREAM_AUDIO_CONCURRENCY", "8"))
+UPSTREAM_PER_USER_CONCURRENCY = int(os.getenv("UPSTREAM_PER_USER_CONCURRENCY", "2"))
+
+# Повторы запросов к API при ответах 429/5xx и сетевых ошибках:
+# количество повторов и границы экспоненциальной задержки (секунды)
+UPSTREAM_MAX_RETRIES = int(os.getenv("UPSTREAM_MAX_RETRIES", "2"))
+UPSTREAM_RETRY_BASE_DELAY = float(os.getenv("UPSTREAM_RETRY_BASE_DELAY", "0.5"))
+UPSTREAM_RETRY_MAX_DELAY = float(os.getenv("UPSTREAM_RETRY_MAX_DELAY", "10"))
+
+# Размыкатель: число ошибок подряд до открытия и время до пробного запроса (секунды)
+CIRCUIT_BREAKER_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_BREAKER_FAILURE_THRESHOLD", "5"))
+CIRCUIT_BREAKER_RESET_TIMEOUT = float(os.getenv("CIRCUIT_BREAKER_RESET_TIMEOUT", "30"))
+
+# Максимальный размер изображения для загрузки в Telegram (байт);
+# изображения больше отправляются ссылкой
+IMAGE_MAX_BYTES = int(os.getenv("IMAGE_MAX_BYTES", str(10 * 1024 * 1024)))
+
+# Дисковый кэш сгенерированных изображений и аудио
+MEDIA_CACHE_ENABLED = os.getenv("MEDIA_CACHE_ENABLED", "1").lower() in ("1", "true", "yes")
+MEDIA_CACHE_DIR = os.getenv("MEDIA_CACHE_DIR", "data/media_cache")
+MEDIA_CACHE_MAX_BYTES = int(os.getenv("MEDIA_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))
+
+# Хранилище состояний FSM: время жизни неактивного состояния (секунды),
+# размер кэша в памяти и интервал удаления устаревших состояний (секунды)
+FSM_STATE_TTL = float(os.getenv("FSM_STATE_TTL", str(24 * 60 * 60)))
+FSM_CACHE_SIZE = int(os.getenv("FSM_CACHE_SIZE", "10000"))
+FSM_CLEANUP_INTERVAL = float(os.getenv("FSM_CLEANUP_INTERVAL", "600"))
+
+# Кэш фотографий пользователей для повторной генерации ответа:
+# максимум записей, суммарный размер (байты) и время жизни (секунды)
+PHOTO_CACHE_SIZE = int(os.getenv("PHOTO_CACHE_SIZE", "1000"))
+PHOTO_CACHE_MAX_BYTES = int(os.getenv("PHOTO_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+PHOTO_CACHE_TTL = float(os.getenv("PHOTO_CACHE_TTL", "1800"))
+
+# Потоковая генерация текста с постепенным обновлением сообщения
+TEXT_STREAMING = os.getenv("TEXT_STREAMING", "1").lower() in ("1", "true", "yes")
+# Минимальный интервал между редактированиями сообщения (с)
+STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", "1.0"))
+
+# Количество последних запросов на модель для расчета времени ответа
+LATENCY_WINDOW = int(os.getenv("LATENCY_WINDOW", "200"))
+# Коэффициент сглаживания EWMA времени ответа и минимум запросов для выводов о модели
+LATENCY_EWMA_ALPHA = float(os.getenv("LATENCY_EWMA_ALPHA", "0.2"))
+LATENCY_MIN_SAMPLES = int(os.getenv("LATENCY_MIN_SAMPLES", "20"))
+
+# Адаптивные таймауты: p99 времени ответа модели с запасом, но не меньше
+# ADAPTIVE_TIMEOUT_MIN и не больше HTTP_TOTAL_TIMEOUT (секунды)
+ADAPTIVE_TIMEOUTS = os.getenv("ADAPTIVE_TIMEOUTS", "1").lower() in ("1", "true", "yes")
+ADAPTIVE_TIMEOUT_MULTIPLIER = float(os.getenv("ADAPTIVE_TIMEOUT_MULTIPLIER", "3"))
+ADAPTIVE_TIMEOUT_MIN = float(os.getenv("ADAPTIVE_TIMEOUT_MIN", "15"))
+
+# Переход на более быструю модель того же типа, если выбранная недоступна
+# или медленнее самой быстрой в MODEL_DEGRADED_FACTOR раз
+MODEL_FALLBACK = os.getenv("MODEL_FALLBACK", "0").lower() in ("1", "true", "yes")
+MODEL_DEGRADED_FACTOR = float(os.getenv("MODEL_DEGRADED_FACTOR", "3"))
+
+# Дублирующие запросы генерации текста: если ответа нет дольше перцентиля
+# TEXT_HEDGE_PERCENTILE времени ответа модели, отправляется второй запрос.
+# Дублей не больше TEXT_HEDGE_BUDGET от всех запросов. Действует только при
+# TEXT_STREAMING = 0: потоковые запросы не дублируются
+TEXT_HEDGING = os.getenv("TEXT_HEDGING", "0").lower() in ("1", "true", "yes")
+TEXT_HEDGE_PERCENTILE = float(os.getenv("TEXT_HEDGE_PERCENTILE", "0.95"))
+TEXT_HEDGE_BUDGET = float(os.getenv("TEXT_HEDGE_BUDGET", "0.05"))
+TEXT_HEDGE_MIN_SAMPLES = int(os.getenv("TEXT_HEDGE_MIN_SAMPLES", "20"))
+
+# Режим получения обновлений: "polling" или "webhook"
+BOT_MODE = os.getenv("BOT_MODE", "polling").lower()
+# Публичный адрес и путь вебхука, секрет для заголовка X-Telegram-Bot-Api-Secret-Token
+WEBHOOK_BASE_URL = os.getenv("WEBHOOK_BASE_URL", "")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+# Максимум одновременно обрабатываемых обновлений в режиме вебхука
+WEBHOOK_MAX_CONCURRENCY = int(os.getenv("WEBHOOK_MAX_CONCURRENCY", "100"))
+# Количество рабочих процессов: при значении больше 1 основной процесс только
+# принимает обновления и распределяет их по рабочим процессам по user_id
+WORKERS = int(os.getenv("WORKERS", "1"))
+# Адрес HTTP сервера вебхука и маршрутов /health и /metrics
+SERVER_HOST = os.getenv("SERVER_HOST", "0.0.0.0")
+SERVER_PORT = int(os.getenv("SERVER_PORT", "8080"))
+# Порт /health и /metrics в режиме polling (0 - не запускать сервер)
+MONITORING_PORT = int(os.getenv("MONITORING_PORT", "0"))
+
+# Ограничения отправки сообщений в Telegram: сообщений в секунду и запас
+# для коротких всплесков - на весь бот и на каждый чат
+TELEGRAM_GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", "30"))
+TELEGRAM_GLOBAL_BURST = float(os.getenv("TELEGRAM_GLOBAL_BURST", "30"))
+TELEGRAM_CHAT_RATE = float(os.getenv("TELEGRAM_CHAT_RATE", "1"))
+TELEGRAM_CHAT_BURST = float(os.getenv("TELEGRAM_CHAT_BURST", "3"))
+# Количество повторов после ответа Telegram "retry after"
+TELEGRAM_MAX_RETRIES = int(os.getenv("TELEGRAM_MAX_RETRIES", "3"))
+
+# Настройки HTTP клиента для запросов к Pollinations API
+HTTP_CONNECTION_LIMIT = int(os.getenv("HTTP_CONNECTION_LIMIT", "100"))
+HTTP_CONNECTION_LIMIT_PER_HOST = int(os.getenv("HTTP_CONNECTION_LIMIT_PER_HOST", "30"))
+HTTP_KEEPALIVE_TIMEOUT = float(os.getenv("HTTP_KEEPALIVE_TIMEOUT", "60"))
+HTTP_DNS_CACHE_TTL = int(os.getenv("HTTP_DNS_CACHE_TTL", "300"))
+HTTP_TOTAL_TIMEOUT = float(os.getenv("HTTP_TOTAL_TIMEOUT", "180"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "10"))
+
 # Доступные модели
 AVAILABLE_MODELS = {
     "Stable Diffusion XL": "sd_xl",
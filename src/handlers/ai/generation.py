@@ -1,19 +1,26 @@
-from datetime import datetime
 from aiogram import types, Bot
 from aiogram.fsm.context import FSMContext
-from io import BytesIO
 from aiogram.types import BufferedInputFile
-
-from src.keyboards.keyboards import get_main_keyboard, get_cancel_keyboard, get_generation_response_keyboard, get_audio_generation_options_keyboard, get_voice_selection_keyboard
-from src.utils.message import safe_edit_message
-from src.utils.user_data import get_user_stats, get_menu_text, update_user_stats
-from src.utils.pollinations import generate_text, generate_image, generate_audio
+from aiogram.exceptions import TelegramBadRequest
+
+from src.keyboards.keyboards import get_main_keyboard, get_cancel_keyboard, get_generation_response_keyboard, get_audio_generation_options_keyboard, get_audio_response_keyboard, get_voice_selection_keyboard
+from src.utils.message import safe_edit_message, stream_to_message, queue_position_updater
+from src.utils.user_data import get_user_stats, get_menu_text, update_user_stats, increment_usage
+from src.utils.pollinations import (
+    generate_text, generate_text_stream, generate_image, generate_audio,
+    image_cache_key, audio_cache_key, text_flight_key
+)
+from src.utils.telegram_files import answer_with_file_cache, download_photo
+from src.managers.upstream_scheduler import upstream_scheduler
+from src.managers.generation_registry import generation_registry, GenerationCancelled
+from src.managers.model_catalog import model_catalog
+from src.managers.telegram_rate_limiter import send_priority, PRIORITY_LOW
 from src.states.user import UserState
-from config.config import AVAILABLE_VOICES
+from config.config import AVAILABLE_VOICES, TEXT_STREAMING
 
 async def start_image_generation(callback: types.CallbackQuery, state: FSMContext):
     user_id = callback.from_user.id
-    stats = get_user_stats(user_id)
+    stats = await get_user_stats(user_id)
     
     if not stats.get("current_model"):
         await safe_edit_message(
@@ -43,7 +50,7 @@ async def start_image_generation(callback: types.CallbackQuery, state: FSMContex
 
 async def start_text_generation(callback: types.CallbackQuery, state: FSMContext):
     user_id = callback.from_user.id
-    stats = get_user_stats(user_id)
+    stats = await get_user_stats(user_id)
     
     if not stats.get("current_model"):
         await safe_edit_message(
@@ -104,22 +111,51 @@ async def start_response_audio_generation(callback: types.CallbackQuery, state:
 
 async def process_image_prompt(message: types.Message, state: FSMContext, bot: Bot):
     user_id = message.from_user.id
-    stats = get_user_stats(user_id)
-    model = stats["current_model"]
+    stats = await get_user_stats(user_id)
+    # При деградации выбранной модели может использоваться более быстрая
+    model = model_catalog.pick_model("image", stats["current_model"])
     
-    status_message = await message.answer("🎨 Генерирую изображение, пожалуйста подождите...")
+    status_text = "🎨 Генерирую изображение, пожалуйста подождите..."
+    status_message = await message.answer(status_text)
     
-    image_url = await generate_image(model, message.text)
-    if image_url:
-        stats["images_generated"] += 1
-        stats["last_used"] = datetime.now()
-        update_user_stats(user_id, stats)
-        
-        await message.answer_photo(
-            photo=image_url,
-            caption=f"✨ Сгенерированное изображение\nПромпт: {message.text}"
-        )
-        await message.answer(get_menu_text(user_id), reply_markup=get_main_keyboard())
+    caption = f"✨ Сгенерированное изображение\nПромпт: {message.text}"
+
+    async def send_photo(photo, media_type):
+        if media_type == "document":
+            # Ранее изображение было отправлено документом - его file_id не подходит для фото
+            return await message.answer_document(document=photo, caption=caption)
+        try:
+            return await message.answer_photo(photo=photo, caption=caption)
+        except TelegramBadRequest:
+            if not isinstance(photo, BufferedInputFile):
+                raise
+            # Telegram не принял файл как фото (например, из-за размеров) - отправляем документом
+            return await message.answer_document(document=photo, caption=caption)
+
+    async def load_photo():
+        image_data, image_url = await generate_image(model, message.text)
+        # Загружаем уже полученные байты, чтобы Telegram не скачивал
+        # изображение повторно; слишком большие изображения отправляем ссылкой
+        if image_data:
+            return BufferedInputFile(image_data, filename="generated_image.jpg")
+        return image_url
+
+    # Уже загруженное в Telegram изображение отправляется по file_id;
+    # позиция в очереди к API показывается в статусном сообщении
+    try:
+        with upstream_scheduler.requester(user_id, queue_position_updater(status_message, status_text)):
+            sent = await generation_registry.run(
+                user_id,
+                answer_with_file_cache(image_cache_key(model, message.text), send_photo, load_photo)
+            )
+    except GenerationCancelled:
+        await status_message.edit_text("❌ Генерация отменена")
+        return
+
+    if sent:
+        increment_usage(user_id, "images_generated")
+        with send_priority(PRIORITY_LOW):
+            await message.answer(await get_menu_text(user_id), reply_markup=get_main_keyboard())
     else:
         await message.answer(
             "❌ Ошибка при генерации изображения",
@@ -131,18 +167,16 @@ async def process_image_prompt(message: types.Message, state: FSMContext, bot: B
 
 async def process_text_prompt(message: types.Message, state: FSMContext, bot: Bot):
     user_id = message.from_user.id
-    stats = get_user_stats(user_id)
+    stats = await get_user_stats(user_id)
     model = stats["current_model"]
 
     # Проверяем наличие изображения и получаем текст
     image_data_bytes = None
+    image_file_id = None
     prompt_text = message.text
 
     if message.photo:
-        photo = message.photo[-1]  # Берем самое большое изображение
-        image_data_io = await bot.download(photo.file_id)
-        # Читаем байты из BytesIO объекта
-        image_data_bytes = image_data_io.read()
+        image_file_id = message.photo[-1].file_id  # Берем самое большое изображение
         # При наличии фото, текст находится в подписи (caption)
         prompt_text = message.caption
 
@@ -154,20 +188,51 @@ async def process_text_prompt(message: types.Message, state: FSMContext, bot: Bo
         )
         return
 
-    # Сохраняем последний запрос пользователя и данные изображения в состояние FSM
-    await state.update_data(last_prompt_text=prompt_text, last_image_data=image_data_bytes)
+    if image_file_id:
+        image_data_bytes = await download_photo(bot, image_file_id)
+        if image_data_bytes is None:
+            await message.answer(
+                "❌ Не удалось загрузить изображение. Попробуйте отправить его еще раз.",
+                reply_markup=get_cancel_keyboard()
+            )
+            return
+
+    # Сохраняем последний запрос пользователя и ссылку на изображение в состояние FSM;
+    # сами байты хранятся в ограниченном кэше и при промахе загружаются заново
+    await state.update_data(last_prompt_text=prompt_text, last_image_file_id=image_file_id)
 
-    status_message = await message.answer(
+    # Запросы с изображением не переводим на другую модель: она может не поддерживать анализ изображений
+    if not image_data_bytes:
+        model = model_catalog.pick_model("text", model)
+
+    status_text = (
         "📝 Генерирую ответ, пожалуйста подождите..." +
         ("\n🖼 Анализирую изображение..." if image_data_bytes else "")
     )
+    status_message = await message.answer(status_text)
 
     # Передаем изображение в байтах и текст в функцию генерации
-    response = await generate_text(model, prompt_text, image_data_bytes, user_id)
+    if TEXT_STREAMING:
+        generation = stream_to_message(
+            status_message,
+            generate_text_stream(model, prompt_text, image_data_bytes, user_id),
+            prefix=f"✨ Ответ от модели <b>{model}</b>:\n\n"
+        )
+    else:
+        generation = generate_text(model, prompt_text, image_data_bytes, user_id)
+    # Новый запрос или отмена прерывают генерацию вместе с запросом к API,
+    # а повтор того же запроса ждет результат уже выполняющейся генерации
+    try:
+        with upstream_scheduler.requester(user_id, queue_position_updater(status_message, status_text)):
+            response = await generation_registry.run(
+                user_id, generation, key=(text_flight_key(model, prompt_text), image_file_id)
+            )
+    except GenerationCancelled:
+        await status_message.edit_text("❌ Генерация отменена")
+        return
+
     if response:
-        stats["texts_generated"] += 1
-        stats["last_used"] = datetime.now()
-        update_user_stats(user_id, stats)
+        increment_usage(user_id, "texts_generated")
 
         # Отправляем ответ с форматированием
         await status_message.edit_text(
@@ -186,7 +251,7 @@ async def process_text_prompt(message: types.Message, state: FSMContext, bot: Bo
 
 async def process_audio_prompt(message: types.Message, state: FSMContext, bot: Bot):
     user_id = message.from_user.id
-    stats = get_user_stats(user_id)
+    stats = await get_user_stats(user_id)
     prompt_text = message.text
 
     if not prompt_text:
@@ -212,7 +277,9 @@ async def process_audio_prompt(message: types.Message, state: FSMContext, bot: B
         audio_gen_type=audio_gen_type
     )
 
-    status_message = await message.answer("🎵 Генерирую аудио, пожалуйста подождите...")
+    status_text = "🎵 Генерирую аудио, пожалуйста подождите..."
+    status_message = await message.answer(status_text)
+    on_queue = queue_position_updater(status_message, status_text)
     
     if audio_gen_type == "response":
         # Для типа "response" сначала генерируем текстовый ответ
@@ -233,7 +300,14 @@ async def process_audio_prompt(message: types.Message, state: FSMContext, bot: B
             return
 
         # Генерируем текстовый ответ
-        response = await generate_text(stats["current_model"], prompt_text, None, user_id)
+        try:
+            with upstream_scheduler.requester(user_id, on_queue):
+                response = await generation_registry.run(
+                    user_id, generate_text(stats["current_model"], prompt_text, None, user_id)
+                )
+        except GenerationCancelled:
+            await status_message.edit_text("❌ Генерация отменена")
+            return
         if not response:
             await status_message.edit_text(
                 "❌ Произошла ошибка при генерации текста. Попробуйте еще раз.",
@@ -250,28 +324,37 @@ async def process_audio_prompt(message: types.Message, state: FSMContext, bot: B
         text_to_speak = prompt_text
         caption = f"🎵 Сгенерированное аудио\n\nТип генерации: {audio_gen_type}\nГолос: {selected_voice}"
 
-    # Генерируем аудио
-    audio_data = await generate_audio("openai-audio", text_to_speak, voice=voice_id)
-
-    if audio_data:
-        stats["audio_generated"] = stats.get("audio_generated", 0) + 1
-        stats["last_used"] = datetime.now()
-        update_user_stats(user_id, stats)
+    async def load_audio():
+        audio_data = await generate_audio("openai-audio", text_to_speak, voice=voice_id)
+        if audio_data:
+            return BufferedInputFile(audio_data, filename="generated_audio.mp3")
+        return None
+
+    # Генерируем аудио и отправляем его с кнопкой повторной генерации;
+    # уже загруженное в Telegram аудио отправляется по file_id
+    try:
+        with upstream_scheduler.requester(user_id, on_queue):
+            sent = await generation_registry.run(user_id, answer_with_file_cache(
+                audio_cache_key("openai-audio", text_to_speak, voice_id),
+                lambda audio, media_type: message.answer_audio(
+                    audio=audio, caption=caption, reply_markup=get_audio_response_keyboard()
+                ),
+                load_audio
+            ))
+    except GenerationCancelled:
+        await status_message.edit_text("❌ Генерация отменена")
+        return
 
-        audio_io = BytesIO(audio_data)
-        audio_io.name = "generated_audio.mp3"
+    if sent:
+        increment_usage(user_id, "audio_generated")
 
         await status_message.edit_text("✅ Аудио сгенерировано!")
-        # Отправляем аудио без кнопок
-        await message.answer_audio(
-            audio=BufferedInputFile(audio_io.read(), filename=audio_io.name),
-            caption=caption
-        )
-        # Отправляем меню отдельным сообщением
-        await message.answer(
-            get_menu_text(user_id),
-            reply_markup=get_main_keyboard()
-        )
+        # Отправляем меню отдельным сообщением после результатов
+        with send_priority(PRIORITY_LOW):
+            await message.answer(
+                await get_menu_text(user_id),
+                reply_markup=get_main_keyboard()
+            )
     else:
         await status_message.edit_text(
             "❌ Произошла ошибка при генерации аудио. Попробуйте еще раз.",
@@ -280,10 +363,12 @@ async def process_audio_prompt(message: types.Message, state: FSMContext, bot: B
         await state.clear()
 
 async def cancel_action(callback: types.CallbackQuery, state: FSMContext):
+    # Прерываем выполняющуюся генерацию, чтобы освободить запрос к API
+    generation_registry.cancel(callback.from_user.id)
     await state.clear()
     await safe_edit_message(
         callback.message,
-        "❌ Действие отменено\n" + get_menu_text(callback.from_user.id),
+        "❌ Действие отменено\n" + await get_menu_text(callback.from_user.id),
         reply_markup=get_main_keyboard()
     )
     await callback.answer()
@@ -292,21 +377,21 @@ async def back_to_menu_from_generation(callback: types.CallbackQuery, state: FSM
     await state.clear()
     # Отправляем новое сообщение с меню вместо редактирования
     await callback.message.answer(
-        get_menu_text(callback.from_user.id),
+        await get_menu_text(callback.from_user.id),
         reply_markup=get_main_keyboard()
     )
     await callback.answer()
 
 async def redo_text_generation(callback: types.CallbackQuery, state: FSMContext, bot: Bot):
     user_id = callback.from_user.id
-    stats = get_user_stats(user_id)
+    stats = await get_user_stats(user_id)
     model = stats["current_model"]
 
     data = await state.get_data()
     last_prompt_text = data.get("last_prompt_text")
-    last_image_data_bytes = data.get("last_image_data")
+    last_image_file_id = data.get("last_image_file_id")
 
-    if not last_prompt_text and not last_image_data_bytes:
+    if not last_prompt_text and not last_image_file_id:
         await callback.message.answer(
             "Нет предыдущего запроса для повторной генерации.",
             reply_markup=get_main_keyboard()
@@ -315,22 +400,49 @@ async def redo_text_generation(callback: types.CallbackQuery, state: FSMContext,
         await callback.answer()
         return
 
+    last_image_data_bytes = None
+    if last_image_file_id:
+        last_image_data_bytes = await download_photo(bot, last_image_file_id)
+        if last_image_data_bytes is None:
+            await callback.message.answer(
+                "❌ Не удалось загрузить изображение из предыдущего запроса.",
+                reply_markup=get_main_keyboard()
+            )
+            await state.clear()
+            await callback.answer()
+            return
+    else:
+        model = model_catalog.pick_model("text", model)
+
     # Отправляем новое сообщение о статусе вместо редактирования
-    status_message = await callback.message.answer(
+    status_text = (
         "🔄 Переделываю ответ..." +
         ("\n🖼 Анализирую изображение..." if last_image_data_bytes else "")
     )
+    status_message = await callback.message.answer(status_text)
 
     # Передаем сохраненные данные изображения и текст в функцию генерации
-    response = await generate_text(model, last_prompt_text, last_image_data_bytes, user_id)
+    if TEXT_STREAMING:
+        generation = stream_to_message(
+            status_message,
+            generate_text_stream(model, last_prompt_text, last_image_data_bytes, user_id),
+            prefix=f"✨ Ответ от модели <b>{model}</b>:\n\n"
+        )
+    else:
+        generation = generate_text(model, last_prompt_text, last_image_data_bytes, user_id)
+    try:
+        with upstream_scheduler.requester(user_id, queue_position_updater(status_message, status_text)):
+            response = await generation_registry.run(user_id, generation)
+    except GenerationCancelled:
+        await status_message.edit_text("❌ Генерация отменена")
+        await callback.answer()
+        return
 
     if response:
-        stats["texts_generated"] += 1 # Учитываем повторную генерацию в статистике
-        stats["last_used"] = datetime.now()
-        update_user_stats(user_id, stats)
+        increment_usage(user_id, "texts_generated") # Учитываем повторную генерацию в статистике
 
-        # Отправляем новое сообщение с ответом вместо редактирования
-        await callback.message.answer(
+        # Показываем ответ в новом сообщении о статусе
+        await status_message.edit_text(
             f"✨ Ответ от модели <b>{model}</b>:\n\n{response}",
             parse_mode="HTML",
             reply_markup=get_generation_response_keyboard()
@@ -366,12 +478,12 @@ async def voice_selected(callback: types.CallbackQuery, state: FSMContext):
         await state.update_data(selected_voice=voice_id)
         # Обновляем статистику пользователя
         user_id = callback.from_user.id
-        stats = get_user_stats(user_id)
+        stats = await get_user_stats(user_id)
         stats["current_voice"] = voice_name
-        update_user_stats(user_id, stats)
+        await update_user_stats(user_id, stats)
         
         await callback.message.edit_text(
-            get_menu_text(user_id),
+            await get_menu_text(user_id),
             reply_markup=get_main_keyboard()
         )
     else:
@@ -381,7 +493,14 @@ async def voice_selected(callback: types.CallbackQuery, state: FSMContext):
         )
 
 async def redo_audio_generation(callback: types.CallbackQuery, state: FSMContext, bot: Bot):
-    """Обработчик для повторной генерации аудио."""
+    """Обработчик для повторной генерации аудио (с тем же голосом - из кэша)."""
+    await _redo_audio(callback, state, bypass_cache=False)
+
+async def new_audio_take(callback: types.CallbackQuery, state: FSMContext, bot: Bot):
+    """Обработчик для нового варианта аудио: генерация заново, минуя кэш."""
+    await _redo_audio(callback, state, bypass_cache=True)
+
+async def _redo_audio(callback: types.CallbackQuery, state: FSMContext, bypass_cache: bool):
     data = await state.get_data()
     last_prompt = data.get("last_audio_prompt")
     
@@ -395,7 +514,7 @@ async def redo_audio_generation(callback: types.CallbackQuery, state: FSMContext
         return
 
     user_id = callback.from_user.id
-    stats = get_user_stats(user_id)
+    stats = await get_user_stats(user_id)
     
     # Получаем выбранный голос из статистики пользователя
     selected_voice = stats.get("current_voice", "alloy")
@@ -405,31 +524,44 @@ async def redo_audio_generation(callback: types.CallbackQuery, state: FSMContext
         voice_id = "alloy"  # Используем голос по умолчанию, если выбранный голос не найден
 
     # Отправляем новое сообщение о статусе вместо редактирования
-    status_message = await callback.message.answer("🔄 Переделываю аудио...")
-
-    # Генерируем аудио напрямую
-    audio_data = await generate_audio("openai-audio", last_prompt, voice=voice_id)
-
-    if audio_data:
-        stats["audio_generated"] = stats.get("audio_generated", 0) + 1
-        stats["last_used"] = datetime.now()
-        update_user_stats(user_id, stats)
+    status_text = "🔄 Переделываю аудио..."
+    status_message = await callback.message.answer(status_text)
+
+    async def load_audio():
+        audio_data = await generate_audio("openai-audio", last_prompt, voice=voice_id, bypass_cache=bypass_cache)
+        if audio_data:
+            return BufferedInputFile(audio_data, filename="generated_audio.mp3")
+        return None
+
+    caption = f"🎵 Сгенерированное аудио\n\nТип генерации: {data.get('audio_gen_type')}\nГолос: {selected_voice}"
+    # Уже загруженное в Telegram аудио отправляется по file_id; для нового
+    # варианта кэш медиа и file_id пропускаются, и новый файл заменяет старый
+    try:
+        with upstream_scheduler.requester(user_id, queue_position_updater(status_message, status_text)):
+            sent = await generation_registry.run(user_id, answer_with_file_cache(
+                audio_cache_key("openai-audio", last_prompt, voice_id),
+                lambda audio, media_type: callback.message.answer_audio(
+                    audio=audio, caption=caption, reply_markup=get_audio_response_keyboard()
+                ),
+                load_audio,
+                bypass_cache=bypass_cache
+            ))
+    except GenerationCancelled:
+        await status_message.edit_text("❌ Генерация отменена")
+        await callback.answer()
+        return
 
-        audio_io = BytesIO(audio_data)
-        audio_io.name = "generated_audio.mp3"
+    if sent:
+        increment_usage(user_id, "audio_generated")
 
         # Отправляем новое сообщение о статусе вместо редактирования
         await callback.message.answer("✅ Аудио перегенерировано!")
-        # Отправляем аудио без кнопок
-        await callback.message.answer_audio(
-            audio=BufferedInputFile(audio_io.read(), filename=audio_io.name),
-            caption=f"🎵 Сгенерированное аудио\n\nТип генерации: {data.get('audio_gen_type')}\nГолос: {selected_voice}"
-        )
-        # Отправляем меню отдельным сообщением
-        await callback.message.answer(
-            get_menu_text(user_id),
-            reply_markup=get_main_keyboard()
-        )
+        # Отправляем меню отдельным сообщением после результатов
+        with send_priority(PRIORITY_LOW):
+            await callback.message.answer(
+                await get_menu_text(user_id),
+                reply_markup=get_main_keyboard()
+            )
     else:
         # Отправляем новое сообщение об ошибке вместо редактирования
         await callback.message.answer(
@@ -4,7 +4,8 @@ from aiogram.fsm.context import FSMContext
 from src.keyboards.keyboards import get_main_keyboard, get_models_keyboard, get_generation_type_keyboard
 from src.utils.message import safe_edit_message
 from src.utils.user_data import get_user_stats, get_menu_text, update_user_stats
-from src.utils.pollinations import fetch_all_models
+from src.managers.model_catalog import model_catalog
+from src.managers.latency_tracker import latency_tracker
 
 async def choose_model_type(callback: types.CallbackQuery):
     await safe_edit_message(
@@ -14,112 +15,47 @@ async def choose_model_type(callback: types.CallbackQuery):
     )
     await callback.answer()
 
-async def show_text_models(callback: types.CallbackQuery):
-    await callback.answer("🔄 Загрузка моделей...")
-    user_id = callback.from_user.id
-    stats = get_user_stats(user_id)
+async def _show_models(callback: types.CallbackQuery, model_type: str, title: str):
+    await callback.answer()
     
-    if not stats.get("text_models"):
+    # Каталог обновляется в фоне, обработчик не ждет сеть
+    models = model_catalog.get(model_type)
+    if not models:
         await safe_edit_message(
             callback.message,
-            "🔄 Загружаю список моделей...",
-            reply_markup=None
+            "⏳ Список моделей еще загружается. Попробуйте через несколько секунд.",
+            reply_markup=get_main_keyboard()
         )
-        text_models, image_models, audio_models = await fetch_all_models()
-        if not text_models:
-            await safe_edit_message(
-                callback.message,
-                "❌ Не удалось загрузить список моделей. Попробуйте позже.",
-                reply_markup=get_main_keyboard()
-            )
-            return
-        
-        stats["text_models"] = text_models
-        stats["image_models"] = image_models
-        stats["audio_models"] = audio_models
-        update_user_stats(user_id, stats)
+        return
     
     await safe_edit_message(
         callback.message,
-        "Выберите модель для генерации текста:",
-        reply_markup=get_models_keyboard(stats["text_models"], "text")
+        title,
+        reply_markup=get_models_keyboard(models, model_type, latency_tracker.p50_by_model(model_type))
     )
 
+async def show_text_models(callback: types.CallbackQuery):
+    await _show_models(callback, "text", "Выберите модель для генерации текста:")
+
 async def show_image_models(callback: types.CallbackQuery):
-    await callback.answer("🔄 Загрузка моделей...")
-    user_id = callback.from_user.id
-    stats = get_user_stats(user_id)
-    
-    if not stats.get("image_models"):
-        await safe_edit_message(
-            callback.message,
-            "🔄 Загружаю список моделей...",
-            reply_markup=None
-        )
-        text_models, image_models, audio_models = await fetch_all_models()
-        if not image_models:
-            await safe_edit_message(
-                callback.message,
-                "❌ Не удалось загрузить список моделей. Попробуйте позже.",
-                reply_markup=get_main_keyboard()
-            )
-            return
-        
-        stats["text_models"] = text_models
-        stats["image_models"] = image_models
-        stats["audio_models"] = audio_models
-        update_user_stats(user_id, stats)
-    
-    await safe_edit_message(
-        callback.message,
-        "Выберите модель для генерации изображений:",
-        reply_markup=get_models_keyboard(stats["image_models"], "image")
-    )
+    await _show_models(callback, "image", "Выберите модель для генерации изображений:")
 
 async def show_audio_models(callback: types.CallbackQuery):
-    await callback.answer("🔄 Загрузка моделей...")
-    user_id = callback.from_user.id
-    stats = get_user_stats(user_id)
-    
-    if not stats.get("audio_models"):
-        await safe_edit_message(
-            callback.message,
-            "🔄 Загружаю список моделей...",
-            reply_markup=None
-        )
-        text_models, image_models, audio_models = await fetch_all_models()
-        if not audio_models:
-            await safe_edit_message(
-                callback.message,
-                "❌ Не удалось загрузить список моделей. Попробуйте позже.",
-                reply_markup=get_main_keyboard()
-            )
-            return
-        
-        stats["text_models"] = text_models
-        stats["image_models"] = image_models
-        stats["audio_models"] = audio_models
-        update_user_stats(user_id, stats)
-    
-    await safe_edit_message(
-        callback.message,
-        "Выберите модель для генерации аудио:",
-        reply_markup=get_models_keyboard(stats["audio_models"], "audio")
-    )
+    await _show_models(callback, "audio", "Выберите модель для генерации аудио:")
 
 async def text_model_selected(callback: types.CallbackQuery):
     user_id = callback.from_user.id
     model_name = callback.data.replace("text_model_", "")
-    stats = get_user_stats(user_id)
+    stats = await get_user_stats(user_id)
     
     # Сохраняем выбранную модель и её тип
     stats["current_model"] = model_name
     stats["model_type"] = "text"
-    update_user_stats(user_id, stats)
+    await update_user_stats(user_id, stats)
     
     await safe_edit_message(
         callback.message,
-        get_menu_text(user_id),
+        await get_menu_text(user_id),
         reply_markup=get_main_keyboard()
     )
     await callback.answer("✅ Модель успешно выбрана!")
@@ -127,16 +63,16 @@ async def text_model_selected(callback: types.CallbackQuery):
 async def image_model_selected(callback: types.CallbackQuery):
     user_id = callback.from_user.id
     model_name = callback.data.replace("image_model_", "")
-    stats = get_user_stats(user_id)
+    stats = await get_user_stats(user_id)
     
     # Сохраняем выбранную модель и её тип
     stats["current_model"] = model_name
     stats["model_type"] = "image"
-    update_user_stats(user_id, stats)
+    await update_user_stats(user_id, stats)
     
     await safe_edit_message(
         callback.message,
-        get_menu_text(user_id),
+        await get_menu_text(user_id),
         reply_markup=get_main_keyboard()
     )
     await callback.answer("✅ Модель успешно выбрана!")
@@ -144,40 +80,29 @@ async def image_model_selected(callback: types.CallbackQuery):
 async def audio_model_selected(callback: types.CallbackQuery):
     user_id = callback.from_user.id
     model_name = callback.data.replace("audio_model_", "")
-    stats = get_user_stats(user_id)
+    stats = await get_user_stats(user_id)
     
     # Сохраняем выбранную модель и её тип
     stats["current_model"] = model_name
     stats["model_type"] = "audio"
-    update_user_stats(user_id, stats)
+    await update_user_stats(user_id, stats)
     
     await safe_edit_message(
         callback.message,
-        get_menu_text(user_id),
+        await get_menu_text(user_id),
         reply_markup=get_main_keyboard()
     )
     await callback.answer("✅ Модель успешно выбрана!")
 
 async def update_models_callback(callback: types.CallbackQuery):
-    await callback.message.edit_text("🔄 Загружаю список доступных моделей...")
-    text_models, image_models, audio_models = await fetch_all_models()
-    
-    if text_models and image_models and audio_models:
-        stats = get_user_stats(callback.from_user.id)
-        stats["text_models"] = text_models
-        stats["image_models"] = image_models
-        stats["audio_models"] = audio_models
-        update_user_stats(callback.from_user.id, stats)
-        
-        await safe_edit_message(
-            callback.message,
-            "✅ Списки моделей успешно обновлены!",
-            reply_markup=get_main_keyboard()
-        )
-    else:
-        await safe_edit_message(
-            callback.message,
-            "❌ Не удалось загрузить списки моделей",
-            reply_markup=get_main_keyboard()
-        )
-    await callback.answer()
\ No newline at end of file
+    # Каталог обновляется в фоне, меню сразу показывает текущие списки
+    model_catalog.refresh_in_background()
+    await safe_edit_message(
+        callback.message,
+        "🔄 Списки моделей обновляются, новые модели появятся в меню выбора через несколько секунд\n\n"
+        f"Сейчас доступно: 🎨 {len(model_catalog.model_names('image'))}, "
+        f"📝 {len(model_catalog.model_names('text'))}, "
+        f"🎵 {len(model_catalog.model_names('audio'))}",
+        reply_markup=get_main_keyboard()
+    )
+    await callback.answer()
@@ -23,7 +23,8 @@ from src.handlers.ai.generation import (
     start_response_audio_generation,
     choose_voice,
     voice_selected,
-    redo_audio_generation
+    redo_audio_generation,
+    new_audio_take
 )
 from src.handlers.ai.history import router as history_router
 from src.managers.chat_manager import chat_manager
@@ -71,6 +72,7 @@ def register_all_handlers(dp: Dispatcher) -> None:
     dp.callback_query.register(back_to_menu_from_generation, lambda c: c.data == "back_to_menu_from_gen")
     dp.callback_query.register(redo_text_generation, lambda c: c.data == "redo_text_generation")
     dp.callback_query.register(redo_audio_generation, lambda c: c.data == "redo_audio_generation")
+    dp.callback_query.register(new_audio_take, lambda c: c.data == "new_audio_take")
 
     # Регистрация обработчиков для работы с историей чата
     dp.include_router(history_router)
@@ -7,10 +7,10 @@ from src.utils.user_data import get_user_stats, get_menu_text
 from src.utils.message import safe_edit_message
 
 async def cmd_start(message: types.Message):
-    get_user_stats(message.from_user.id)  # Инициализация статистики пользователя
+    await get_user_stats(message.from_user.id)  # Инициализация статистики пользователя
     await message.answer(
         "👋 Привет! Я бот для работы с Pollinations.ai API.\n" + 
-        get_menu_text(message.from_user.id),
+        await get_menu_text(message.from_user.id),
         reply_markup=get_main_keyboard()
     )
 
@@ -31,7 +31,7 @@ async def about_button(callback: types.CallbackQuery):
 async def back_to_menu(callback: types.CallbackQuery):
     await safe_edit_message(
         callback.message,
-        get_menu_text(callback.from_user.id),
+        await get_menu_text(callback.from_user.id),
         reply_markup=get_main_keyboard()
     )
     await callback.answer()
\ No newline at end of file
@@ -1,3 +1,4 @@
+from typing import Dict, Optional
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, ReplyKeyboardMarkup, KeyboardButton
 from config.config import AVAILABLE_MODELS, AVAILABLE_VOICES
 
@@ -25,7 +26,14 @@ def get_main_keyboard() -> InlineKeyboardMarkup:
     ]
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
-def get_models_keyboard(models_data: list, model_type: str = "image") -> InlineKeyboardMarkup:
+def _model_label(name: str, latencies: Optional[Dict[str, float]]) -> str:
+    """Имя модели с медианой недавнего времени ответа, если она известна."""
+    if latencies and name in latencies:
+        return f"{name} ⏱{latencies[name]:.1f}с"
+    return name
+
+def get_models_keyboard(models_data: list, model_type: str = "image",
+                        latencies: Optional[Dict[str, float]] = None) -> InlineKeyboardMarkup:
     keyboard = []
     if model_type == "text":
         for model in models_data:
@@ -33,7 +41,7 @@ def get_models_keyboard(models_data: list, model_type: str = "image") -> InlineK
             description = model.get("description", "Нет описания")
             keyboard.append([
                 InlineKeyboardButton(
-                    text=f"{name} - {description[:30]}...",
+                    text=f"{_model_label(name, latencies)} - {description[:30]}...",
                     callback_data=f"text_model_{name}"
                 )
             ])
@@ -43,7 +51,7 @@ def get_models_keyboard(models_data: list, model_type: str = "image") -> InlineK
             description = model.get("description", "Нет описания")
             keyboard.append([
                 InlineKeyboardButton(
-                    text=f"{name} - {description}",
+                    text=f"{_model_label(name, latencies)} - {description}",
                     callback_data=f"audio_model_{name}"
                 )
             ])
@@ -51,7 +59,7 @@ def get_models_keyboard(models_data: list, model_type: str = "image") -> InlineK
         for model_name in models_data:
             keyboard.append([
                 InlineKeyboardButton(
-                    text=model_name,
+                    text=_model_label(model_name, latencies),
                     callback_data=f"image_model_{model_name}"
                 )
             ])
@@ -110,6 +118,16 @@ def get_generation_response_keyboard() -> InlineKeyboardMarkup:
     ]
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
+def get_audio_response_keyboard() -> InlineKeyboardMarkup:
+    """Создание клавиатуры под сгенерированным аудио."""
+    keyboard = [
+        [
+            InlineKeyboardButton(text="🔄 Переделать аудио", callback_data="redo_audio_generation"),
+            InlineKeyboardButton(text="🎲 Новый вариант", callback_data="new_audio_take")
+        ]
+    ]
+    return InlineKeyboardMarkup(inline_keyboard=keyboard)
+
 def get_audio_generation_options_keyboard() -> InlineKeyboardMarkup:
     """Создание клавиатуры для выбора типа генерации аудио."""
     keyboard = [
@@ -0,0 +1,101 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Any, Callable, Optional, Tuple, TypeVar
+
+from .database import DatabaseManager, db
+
+T = TypeVar("T")
+
+class AsyncDatabaseManager:
+    """Асинхронная обертка над DatabaseManager.
+
+    Все запросы выполняются в одном выделенном потоке, поэтому event loop
+    не блокируется, а запросы выполняются строго в порядке их поступления.
+    """
+
+    def __init__(self, database: DatabaseManager):
+        self.db = database
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+
+    async def run(self, func: Callable[..., T], *args, **kwargs) -> T:
+        """Выполнение синхронной функции в потоке базы данных."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+
+    async def add_chat_message(self, user_id: int, message: str, role: str = "user") -> None:
+        """Добавление сообщения в историю чата."""
+        await self.run(self.db.add_chat_message, user_id, message, role)
+
+    async def get_chat_history(self, user_id: int, limit: int = 10) -> List[Dict[str, Any]]:
+        """Получение истории чата пользователя."""
+        return await self.run(self.db.get_chat_history, user_id, limit)
+
+    async def clear_old_messages(self, days: int = 7) -> None:
+        """Очистка старых сообщений из истории чата."""
+        await self.run(self.db.clear_old_messages, days)
+
+    async def clear_user_history(self, user_id: int) -> None:
+        """Очистка всей истории чата для конкретного пользователя."""
+        await self.run(self.db.clear_user_history, user_id)
+
+    async def get_chat_token_total(self, user_id: int) -> int:
+        """Суммарное количество токенов в истории чата пользователя."""
+        return await self.run(self.db.get_chat_token_total, user_id)
+
+    async def get_chat_context(self, user_id: int, max_tokens: int = 2000) -> List[Dict[str, str]]:
+        """Получение контекста чата с учетом ограничения токенов."""
+        return await self.run(self.db.get_chat_context, user_id, max_tokens)
+
+    async def get_user_stats(self, user_id: int) -> Dict[str, Any]:
+        """Получение статистики пользователя."""
+        return await self.run(self.db.get_user_stats, user_id)
+
+    async def update_user_stats(self, user_id: int, stats: Dict[str, Any]) -> None:
+        """Обновление настроек пользователя."""
+        await self.run(self.db.update_user_stats, user_id, stats)
+
+    async def get_model_catalog(self) -> Dict[str, Dict[str, Any]]:
+        """Получение сохраненного каталога моделей по типам."""
+        return await self.run(self.db.get_model_catalog)
+
+    async def save_model_catalog(self, catalog: Dict[str, Dict[str, Any]]) -> None:
+        """Сохранение каталога моделей."""
+        await self.run(self.db.save_model_catalog, catalog)
+
+    async def get_telegram_file(self, cache_key: str) -> Optional[Tuple[str, Optional[str]]]:
+        """Получение загруженного в Telegram файла: (file_id, тип медиа)."""
+        return await self.run(self.db.get_telegram_file, cache_key)
+
+    async def save_telegram_file(self, cache_key: str, file_id: str, media_type: str) -> None:
+        """Сохранение file_id и типа медиа загруженного в Telegram файла."""
+        await self.run(self.db.save_telegram_file, cache_key, file_id, media_type)
+
+    async def delete_telegram_file(self, cache_key: str) -> None:
+        """Удаление недействительного file_id."""
+        await self.run(self.db.delete_telegram_file, cache_key)
+
+    async def get_fsm_record(self, storage_key: str) -> Optional[Tuple[Optional[str], Optional[str], float]]:
+        """Получение состояния FSM: (состояние, данные в JSON, время изменения)."""
+        return await self.run(self.db.get_fsm_record, storage_key)
+
+    async def update_fsm_record(self, storage_key: str, field: str, value: Optional[str],
+                                updated_at: float, expired_before: float) -> None:
+        """Изменение состояния или данных FSM."""
+        await self.run(self.db.update_fsm_record, storage_key, field, value, updated_at, expired_before)
+
+    async def delete_expired_fsm_records(self, updated_before: float) -> int:
+        """Удаление состояний FSM, не изменявшихся с указанного времени."""
+        return await self.run(self.db.delete_expired_fsm_records, updated_before)
+
+    async def increment_usage(self, increments: Dict[int, Dict[str, Any]]) -> None:
+        """Атомарное увеличение счетчиков использования одной транзакцией."""
+        await self.run(self.db.increment_usage, increments)
+
+    async def close(self) -> None:
+        """Завершение очереди запросов и закрытие соединения."""
+        await self.run(self.db.close)
+        self._executor.shutdown(wait=True)
+
+# Создаем глобальный экземпляр асинхронного менеджера базы данных
+async_db = AsyncDatabaseManager(db)
@@ -0,0 +1,94 @@
+import logging
+import time
+from typing import Any, Dict, Tuple
+
+from config.config import CIRCUIT_BREAKER_FAILURE_THRESHOLD, CIRCUIT_BREAKER_RESET_TIMEOUT
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+class CircuitOpenError(Exception):
+    """Запрос отклонен без обращения к API, так как размыкатель открыт."""
+
+class CircuitBreaker:
+    """Размыкатель для одного типа запросов и одной модели.
+
+    После failure_threshold неудачных запросов подряд размыкатель открывается
+    и запросы сразу отклоняются. Через reset_timeout секунд пропускается один
+    пробный запрос: при успехе размыкатель закрывается, при ошибке снова
+    открывается.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = CIRCUIT_BREAKER_FAILURE_THRESHOLD,
+                 reset_timeout: float = CIRCUIT_BREAKER_RESET_TIMEOUT):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+
+    def allow_request(self) -> bool:
+        """Можно ли отправить запрос."""
+        if self.state == CLOSED:
+            return True
+        now = time.monotonic()
+        if now - self.opened_at >= self.reset_timeout:
+            # Следующий пробный запрос - не раньше чем через reset_timeout,
+            # даже если этот не завершится
+            self.state = HALF_OPEN
+            self.opened_at = now
+            return True
+        return False
+
+    def check(self) -> None:
+        """Проверка перед запросом; выбрасывает CircuitOpenError, если запрос нельзя отправить."""
+        if not self.allow_request():
+            raise CircuitOpenError(f"Модель временно недоступна ({self.name}), попробуйте позже")
+
+    def record_success(self) -> None:
+        if self.state != CLOSED:
+            logging.info(f"Размыкатель {self.name} закрыт")
+        self.state = CLOSED
+        self.failures = 0
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+            if self.state == CLOSED:
+                logging.warning(f"Размыкатель {self.name} открыт после {self.failures} ошибок подряд")
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+
+    def stats(self) -> Dict[str, Any]:
+        """Состояние размыкателя."""
+        retry_in = 0.0
+        if self.state != CLOSED:
+            retry_in = max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+        return {"state": self.state, "failures": self.failures, "retry_in": round(retry_in, 1)}
+
+class CircuitBreakerRegistry:
+    """Размыкатели по типам запросов и моделям."""
+
+    def __init__(self):
+        self._breakers: Dict[Tuple[str, str], CircuitBreaker] = {}
+
+    def get(self, endpoint: str, model_name: str) -> CircuitBreaker:
+        key = (endpoint, model_name)
+        breaker = self._breakers.get(key)
+        if breaker is None:
+            breaker = self._breakers[key] = CircuitBreaker(f"{endpoint}:{model_name}")
+        return breaker
+
+    def is_closed(self, endpoint: str, model_name: str) -> bool:
+        """Закрыт ли размыкатель (модели без запросов считаются доступными)."""
+        breaker = self._breakers.get((endpoint, model_name))
+        return breaker is None or breaker.state == CLOSED
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Состояние всех размыкателей для мониторинга."""
+        return {breaker.name: breaker.stats() for breaker in self._breakers.values()}
+
+# Создаем глобальный реестр размыкателей
+circuit_breakers = CircuitBreakerRegistry()
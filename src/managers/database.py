@@ -1,7 +1,17 @@
+import json
 import sqlite3
 import os
+import threading
+from contextlib import contextmanager
 from datetime import datetime, timedelta
-from typing import Optional, Dict, List, Any, Tuple
+from typing import Optional, Dict, List, Any, Tuple, Iterator
+
+from config.config import (
+    DATABASE_FILE, DB_CACHE_SIZE_KB, DB_MMAP_SIZE, DB_BUSY_TIMEOUT_MS,
+    USER_CACHE_SIZE, USER_CACHE_TTL
+)
+from src.utils.cache import LRUCache
+from src.utils.tokenizer import count_tokens
 
 class DatabaseManager:
     _instance = None
@@ -16,15 +26,55 @@ class DatabaseManager:
         # Инициализируем только один раз
         if not DatabaseManager._initialized:
             # Создаем директорию data, если она не существует
-            os.makedirs(os.path.dirname(db_file), exist_ok=True)
+            os.makedirs(os.path.dirname(db_file) or ".", exist_ok=True)
             self.db_file = db_file
+            self._lock = threading.RLock()
+            self._conn = self._connect()
+            # Кэш профилей пользователей, сбрасывается при любом изменении
+            self.user_cache = LRUCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
             self._create_tables()
             DatabaseManager._initialized = True
 
+    def _connect(self) -> sqlite3.Connection:
+        """Открытие долгоживущего соединения с настройкой PRAGMA."""
+        conn = sqlite3.connect(
+            self.db_file,
+            timeout=DB_BUSY_TIMEOUT_MS / 1000,
+            check_same_thread=False
+        )
+        # WAL позволяет читать параллельно с записью, а NORMAL в WAL режиме
+        # не делает fsync на каждый коммит
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        # Отрицательное значение cache_size задается в килобайтах
+        conn.execute(f"PRAGMA cache_size=-{DB_CACHE_SIZE_KB}")
+        conn.execute(f"PRAGMA mmap_size={DB_MMAP_SIZE}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute(f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}")
+        return conn
+
+    @contextmanager
+    def _cursor(self) -> Iterator[sqlite3.Cursor]:
+        """Курсор постоянного соединения; транзакция фиксируется при выходе."""
+        with self._lock:
+            cursor = self._conn.cursor()
+            try:
+                yield cursor
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                raise
+            finally:
+                cursor.close()
+
+    def close(self) -> None:
+        """Закрытие соединения с базой данных."""
+        with self._lock:
+            self._conn.close()
+
     def _create_tables(self) -> None:
         """Создание необходимых таблиц в базе данных."""
-        with sqlite3.connect(self.db_file) as conn:
-            cursor = conn.cursor()
+        with self._cursor() as cursor:
             
             # Таблица пользователей
             cursor.execute("""
@@ -40,16 +90,46 @@ class DatabaseManager:
                 )
             """)
             
-            # Таблица для хранения моделей пользователей
+            # Общий каталог моделей (один на всех пользователей)
             cursor.execute("""
-                CREATE TABLE IF NOT EXISTS user_models (
-                    user_id INTEGER,
-                    model_type TEXT,
-                    models TEXT,
-                    FOREIGN KEY (user_id) REFERENCES users (user_id),
-                    PRIMARY KEY (user_id, model_type)
+                CREATE TABLE IF NOT EXISTS model_catalog (
+                    model_type TEXT PRIMARY KEY,
+                    models TEXT NOT NULL,
+                    version INTEGER NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+
+            # Идентификаторы уже загруженных в Telegram файлов по ключу генерации
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS telegram_files (
+                    cache_key TEXT PRIMARY KEY,
+                    file_id TEXT NOT NULL,
+                    media_type TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            # Тип медиа нужен, чтобы отправить file_id тем же методом, которым файл был загружен
+            cursor.execute("PRAGMA table_info(telegram_files)")
+            if "media_type" not in {row[1] for row in cursor.fetchall()}:
+                cursor.execute("ALTER TABLE telegram_files ADD COLUMN media_type TEXT")
+
+            # Состояния FSM пользователей (данные - компактный JSON)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS fsm_states (
+                    storage_key TEXT PRIMARY KEY,
+                    state TEXT,
+                    data TEXT,
+                    updated_at REAL NOT NULL
                 )
             """)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_fsm_states_updated_at
+                ON fsm_states (updated_at)
+            """)
+
+            # Копии каталога моделей у каждого пользователя больше не хранятся
+            cursor.execute("DROP TABLE IF EXISTS user_models")
 
             # Таблица для хранения истории чата
             cursor.execute("""
@@ -59,31 +139,89 @@ class DatabaseManager:
                     message TEXT,
                     role TEXT,
                     timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    token_count INTEGER,
                     FOREIGN KEY (user_id) REFERENCES users (user_id)
                 )
             """)
-            
-            conn.commit()
+
+            # Суммарное количество токенов в истории каждого пользователя
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS chat_token_totals (
+                    user_id INTEGER PRIMARY KEY,
+                    total_tokens INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+
+            self._migrate_chat_history(cursor)
+
+            # Покрывающий индекс для выбора окна контекста без чтения текстов
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_chat_history_user_tokens
+                ON chat_history (user_id, timestamp, id, token_count)
+            """)
+
+    def _migrate_chat_history(self, cursor: sqlite3.Cursor) -> None:
+        """Миграция истории чата: колонка token_count и пересчет итогов."""
+        cursor.execute("PRAGMA table_info(chat_history)")
+        columns = {row[1] for row in cursor.fetchall()}
+        if "token_count" not in columns:
+            cursor.execute("ALTER TABLE chat_history ADD COLUMN token_count INTEGER")
+        # Индекс без token_count заменен покрывающим индексом
+        cursor.execute("DROP INDEX IF EXISTS idx_chat_history_user_timestamp")
+
+        # Заполняем количество токенов для старых строк порциями
+        backfilled = False
+        while True:
+            cursor.execute("""
+                SELECT id, message FROM chat_history
+                WHERE token_count IS NULL
+                LIMIT 1000
+            """)
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            cursor.executemany(
+                "UPDATE chat_history SET token_count = ? WHERE id = ?",
+                [(count_tokens(message), row_id) for row_id, message in rows]
+            )
+            backfilled = True
+
+        if backfilled:
+            self._rebuild_token_totals(cursor)
+
+    def _rebuild_token_totals(self, cursor: sqlite3.Cursor) -> None:
+        """Пересчет суммарного количества токенов по всем пользователям."""
+        cursor.execute("DELETE FROM chat_token_totals")
+        cursor.execute("""
+            INSERT INTO chat_token_totals (user_id, total_tokens)
+            SELECT user_id, SUM(token_count)
+            FROM chat_history
+            GROUP BY user_id
+        """)
 
     def add_chat_message(self, user_id: int, message: str, role: str = "user") -> None:
         """Добавление сообщения в историю чата."""
-        with sqlite3.connect(self.db_file) as conn:
-            cursor = conn.cursor()
+        token_count = count_tokens(message)
+        with self._cursor() as cursor:
             cursor.execute("""
-                INSERT INTO chat_history (user_id, message, role)
-                VALUES (?, ?, ?)
-            """, (user_id, message, role))
-            conn.commit()
+                INSERT INTO chat_history (user_id, message, role, token_count)
+                VALUES (?, ?, ?, ?)
+            """, (user_id, message, role, token_count))
+            cursor.execute("""
+                INSERT INTO chat_token_totals (user_id, total_tokens)
+                VALUES (?, ?)
+                ON CONFLICT (user_id) DO UPDATE
+                SET total_tokens = total_tokens + excluded.total_tokens
+            """, (user_id, token_count))
 
     def get_chat_history(self, user_id: int, limit: int = 10) -> List[Dict[str, Any]]:
         """Получение истории чата пользователя."""
-        with sqlite3.connect(self.db_file) as conn:
-            cursor = conn.cursor()
+        with self._cursor() as cursor:
             cursor.execute("""
                 SELECT message, role, timestamp
                 FROM chat_history
                 WHERE user_id = ?
-                ORDER BY timestamp DESC
+                ORDER BY timestamp DESC, id DESC
                 LIMIT ?
             """, (user_id, limit))
             
@@ -98,57 +236,96 @@ class DatabaseManager:
 
     def clear_old_messages(self, days: int = 7) -> None:
         """Очистка старых сообщений из истории чата."""
-        with sqlite3.connect(self.db_file) as conn:
-            cursor = conn.cursor()
+        with self._cursor() as cursor:
             cutoff_date = datetime.now() - timedelta(days=days)
             cursor.execute("""
                 DELETE FROM chat_history
                 WHERE timestamp < ?
             """, (cutoff_date,))
-            conn.commit()
+            self._rebuild_token_totals(cursor)
 
     def clear_user_history(self, user_id: int) -> None:
         """Очистка всей истории чата для конкретного пользователя."""
-        with sqlite3.connect(self.db_file) as conn:
-            cursor = conn.cursor()
+        with self._cursor() as cursor:
             cursor.execute("""
                 DELETE FROM chat_history
                 WHERE user_id = ?
             """, (user_id,))
-            conn.commit()
+            cursor.execute("DELETE FROM chat_token_totals WHERE user_id = ?", (user_id,))
+
+    def get_chat_token_total(self, user_id: int) -> int:
+        """Суммарное количество токенов в истории чата пользователя."""
+        with self._cursor() as cursor:
+            cursor.execute(
+                "SELECT total_tokens FROM chat_token_totals WHERE user_id = ?",
+                (user_id,)
+            )
+            row = cursor.fetchone()
+            return row[0] if row else 0
 
     def get_chat_context(self, user_id: int, max_tokens: int = 2000) -> List[Dict[str, str]]:
         """Получение контекста чата с учетом ограничения токенов."""
-        with sqlite3.connect(self.db_file) as conn:
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT message, role
-                FROM chat_history
-                WHERE user_id = ?
-                ORDER BY timestamp DESC
-            """, (user_id,))
-            
-            messages = []
-            total_tokens = 0
-            
-            for row in cursor.fetchall():
-                message = row[0]
-                role = row[1]
-                # Примерная оценка токенов (4 символа ~ 1 токен)
-                message_tokens = len(message) // 4
-                
-                if total_tokens + message_tokens > max_tokens:
-                    break
-                    
-                messages.insert(0, {"role": role, "content": message})
-                total_tokens += message_tokens
-            
-            return messages
+        with self._cursor() as cursor:
+            cursor.execute(
+                "SELECT total_tokens FROM chat_token_totals WHERE user_id = ?",
+                (user_id,)
+            )
+            row = cursor.fetchone()
+            if not row:
+                return []
+
+            if row[0] <= max_tokens:
+                # Вся история помещается в бюджет
+                cursor.execute("""
+                    SELECT role, message
+                    FROM chat_history
+                    WHERE user_id = ?
+                    ORDER BY timestamp, id
+                """, (user_id,))
+            else:
+                # Накопленная сумма считается по покрывающему индексу от новых
+                # сообщений к старым без чтения текстов и останавливается,
+                # как только исчерпан бюджет
+                cursor.execute("""
+                    SELECT timestamp, id, token_count
+                    FROM chat_history
+                    WHERE user_id = ?
+                    ORDER BY timestamp DESC, id DESC
+                """, (user_id,))
+
+                window_start = None
+                total_tokens = 0
+                for timestamp, row_id, token_count in cursor:
+                    if total_tokens + token_count > max_tokens:
+                        break
+                    total_tokens += token_count
+                    window_start = (timestamp, row_id)
+
+                if window_start is None:
+                    return []
+
+                # Тексты читаются только для сообщений, попавших в окно
+                cursor.execute("""
+                    SELECT role, message
+                    FROM chat_history
+                    WHERE user_id = ? AND (timestamp, id) >= (?, ?)
+                    ORDER BY timestamp, id
+                """, (user_id, *window_start))
+
+            return [{"role": role, "content": message} for role, message in cursor]
 
     def get_user_stats(self, user_id: int) -> Dict[str, Any]:
-        """Получение статистики пользователя."""
-        with sqlite3.connect(self.db_file) as conn:
-            cursor = conn.cursor()
+        """Получение статистики пользователя (с кэшированием)."""
+        stats = self.user_cache.get(user_id)
+        if stats is None:
+            stats = self._load_user_stats(user_id)
+            self.user_cache.set(user_id, stats)
+        # Возвращаем копию, чтобы изменения вызывающего кода не попали в кэш
+        return dict(stats)
+
+    def _load_user_stats(self, user_id: int) -> Dict[str, Any]:
+        """Чтение статистики пользователя из базы данных."""
+        with self._cursor() as cursor:
             
             # Проверяем существование пользователя
             cursor.execute("SELECT * FROM users WHERE user_id = ?", (user_id,))
@@ -160,7 +337,6 @@ class DatabaseManager:
                     "INSERT INTO users (user_id, images_generated, texts_generated, audio_generated) VALUES (?, 0, 0, 0)",
                     (user_id,)
                 )
-                conn.commit()
                 return {
                     "images_generated": 0,
                     "texts_generated": 0,
@@ -168,19 +344,9 @@ class DatabaseManager:
                     "last_used": None,
                     "current_model": None,
                     "model_type": None,
-                    "current_voice": None,
-                    "text_models": None,
-                    "image_models": None,
-                    "audio_models": None
+                    "current_voice": None
                 }
             
-            # Получаем модели пользователя
-            cursor.execute(
-                "SELECT model_type, models FROM user_models WHERE user_id = ?",
-                (user_id,)
-            )
-            models = {row[0]: eval(row[1]) for row in cursor.fetchall()}
-            
             return {
                 "images_generated": user[1],
                 "texts_generated": user[2],
@@ -188,62 +354,138 @@ class DatabaseManager:
                 "last_used": user[4],
                 "current_model": user[5],
                 "model_type": user[6],
-                "current_voice": user[7],
-                "text_models": models.get("text"),
-                "image_models": models.get("image"),
-                "audio_models": models.get("audio")
+                "current_voice": user[7]
             }
 
     def update_user_stats(self, user_id: int, stats: Dict[str, Any]) -> None:
-        """Обновление статистики пользователя."""
-        with sqlite3.connect(self.db_file) as conn:
-            cursor = conn.cursor()
+        """Обновление настроек пользователя."""
+        with self._cursor() as cursor:
             
-            # Обновляем основные данные пользователя
+            # Обновляем настройки пользователя. Счетчики и время последнего
+            # использования меняются только через increment_usage
             cursor.execute("""
                 UPDATE users 
-                SET images_generated = ?,
-                    texts_generated = ?,
-                    audio_generated = ?,
-                    last_used = ?,
-                    current_model = ?,
+                SET current_model = ?,
                     model_type = ?,
                     current_voice = ?
                 WHERE user_id = ?
             """, (
-                stats.get("images_generated", 0),
-                stats.get("texts_generated", 0),
-                stats.get("audio_generated", 0),
-                stats.get("last_used"),
                 stats.get("current_model"),
                 stats.get("model_type"),
                 stats.get("current_voice"),
                 user_id
             ))
-            
-            # Обновляем модели пользователя
-            if "text_models" in stats:
-                cursor.execute("""
-                    INSERT OR REPLACE INTO user_models (user_id, model_type, models)
-                    VALUES (?, 'text', ?)
-                """, (user_id, str(stats["text_models"])))
-            
-            if "image_models" in stats:
-                cursor.execute("""
-                    INSERT OR REPLACE INTO user_models (user_id, model_type, models)
-                    VALUES (?, 'image', ?)
-                """, (user_id, str(stats["image_models"])))
-            
-            if "audio_models" in stats:
-                cursor.execute("""
-                    INSERT OR REPLACE INTO user_models (user_id, model_type, models)
-                    VALUES (?, 'audio', ?)
-                """, (user_id, str(stats["audio_models"])))
-            
-            conn.commit()
+
+        self.user_cache.invalidate(user_id)
+
+    def get_model_catalog(self) -> Dict[str, Dict[str, Any]]:
+        """Получение сохраненного каталога моделей по типам."""
+        with self._cursor() as cursor:
+            cursor.execute("SELECT model_type, models, version, updated_at FROM model_catalog")
+            return {
+                model_type: {
+                    "models": json.loads(models),
+                    "version": version,
+                    "updated_at": updated_at
+                }
+                for model_type, models, version, updated_at in cursor.fetchall()
+            }
+
+    def save_model_catalog(self, catalog: Dict[str, Dict[str, Any]]) -> None:
+        """Сохранение каталога моделей."""
+        with self._cursor() as cursor:
+            cursor.executemany("""
+                INSERT OR REPLACE INTO model_catalog (model_type, models, version, updated_at)
+                VALUES (?, ?, ?, ?)
+            """, [
+                (model_type, json.dumps(entry["models"], ensure_ascii=False), entry["version"], entry["updated_at"])
+                for model_type, entry in catalog.items()
+            ])
+
+    def get_telegram_file(self, cache_key: str) -> Optional[Tuple[str, Optional[str]]]:
+        """Получение загруженного в Telegram файла: (file_id, тип медиа)."""
+        with self._cursor() as cursor:
+            cursor.execute("SELECT file_id, media_type FROM telegram_files WHERE cache_key = ?", (cache_key,))
+            return cursor.fetchone()
+
+    def save_telegram_file(self, cache_key: str, file_id: str, media_type: str) -> None:
+        """Сохранение file_id и типа медиа загруженного в Telegram файла."""
+        with self._cursor() as cursor:
+            cursor.execute("""
+                INSERT OR REPLACE INTO telegram_files (cache_key, file_id, media_type)
+                VALUES (?, ?, ?)
+            """, (cache_key, file_id, media_type))
+
+    def delete_telegram_file(self, cache_key: str) -> None:
+        """Удаление недействительного file_id."""
+        with self._cursor() as cursor:
+            cursor.execute("DELETE FROM telegram_files WHERE cache_key = ?", (cache_key,))
+
+    def get_fsm_record(self, storage_key: str) -> Optional[Tuple[Optional[str], Optional[str], float]]:
+        """Получение состояния FSM: (состояние, данные в JSON, время изменения)."""
+        with self._cursor() as cursor:
+            cursor.execute(
+                "SELECT state, data, updated_at FROM fsm_states WHERE storage_key = ?",
+                (storage_key,)
+            )
+            return cursor.fetchone()
+
+    def update_fsm_record(self, storage_key: str, field: str, value: Optional[str],
+                          updated_at: float, expired_before: float) -> None:
+        """Изменение состояния или данных FSM (field - "state" или "data").
+
+        Второе поле сохраняется, если запись не устарела; пустые записи удаляются.
+        """
+        other = {"state": "data", "data": "state"}[field]
+        with self._cursor() as cursor:
+            cursor.execute(f"""
+                INSERT INTO fsm_states (storage_key, {field}, {other}, updated_at)
+                VALUES (?, ?, NULL, ?)
+                ON CONFLICT (storage_key) DO UPDATE
+                SET {field} = excluded.{field},
+                    {other} = CASE WHEN fsm_states.updated_at < ? THEN NULL ELSE fsm_states.{other} END,
+                    updated_at = excluded.updated_at
+            """, (storage_key, value, updated_at, expired_before))
+            cursor.execute("""
+                DELETE FROM fsm_states
+                WHERE storage_key = ? AND state IS NULL AND data IS NULL
+            """, (storage_key,))
+
+    def delete_expired_fsm_records(self, updated_before: float) -> int:
+        """Удаление состояний FSM, не изменявшихся с указанного времени."""
+        with self._cursor() as cursor:
+            cursor.execute("DELETE FROM fsm_states WHERE updated_at < ?", (updated_before,))
+            return cursor.rowcount
+
+    def increment_usage(self, increments: Dict[int, Dict[str, Any]]) -> None:
+        """Атомарное увеличение счетчиков использования одной транзакцией.
+
+        increments: {user_id: {"images_generated": n, ..., "last_used": datetime}}
+        """
+        with self._cursor() as cursor:
+            cursor.executemany("""
+                UPDATE users
+                SET images_generated = images_generated + ?,
+                    texts_generated = texts_generated + ?,
+                    audio_generated = audio_generated + ?,
+                    last_used = COALESCE(?, last_used)
+                WHERE user_id = ?
+            """, [
+                (
+                    counters.get("images_generated", 0),
+                    counters.get("texts_generated", 0),
+                    counters.get("audio_generated", 0),
+                    counters.get("last_used"),
+                    user_id
+                )
+                for user_id, counters in increments.items()
+            ])
+
+        for user_id in increments:
+            self.user_cache.invalidate(user_id)
 
     @classmethod
-    def get_instance(cls, db_file: str = "data/bot_data.db") -> 'DatabaseManager':
+    def get_instance(cls, db_file: str = DATABASE_FILE) -> 'DatabaseManager':
         """Получение единственного экземпляра класса DatabaseManager."""
         if cls._instance is None:
             cls._instance = DatabaseManager(db_file)
@@ -0,0 +1,115 @@
+import asyncio
+import json
+import logging
+import time
+from typing import Any, Dict, Mapping, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+from config.config import FSM_STATE_TTL, FSM_CACHE_SIZE, FSM_CLEANUP_INTERVAL
+from src.utils.cache import LRUCache
+from .async_database import async_db
+
+class SQLiteStorage(BaseStorage):
+    """Хранилище состояний FSM в базе данных бота.
+
+    Состояния переживают перезапуск и доступны нескольким процессам.
+    Запись идет сразу в базу, чтение - через кэш в памяти, поэтому каждый
+    пользователь должен обслуживаться одним процессом. Состояния, которые
+    не менялись дольше ttl секунд, считаются пустыми и периодически
+    удаляются из базы.
+    """
+
+    def __init__(self, ttl: float = FSM_STATE_TTL, cache_size: int = FSM_CACHE_SIZE,
+                 cleanup_interval: float = FSM_CLEANUP_INTERVAL):
+        self.ttl = ttl
+        self.cleanup_interval = cleanup_interval
+        # Кэш хранит (состояние, данные в JSON, время изменения)
+        self._cache = LRUCache(maxsize=cache_size)
+        self._cleanup_task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def _key(key: StorageKey) -> str:
+        return ":".join(str(part) if part is not None else "" for part in (
+            key.bot_id, key.chat_id, key.user_id, key.thread_id, key.business_connection_id, key.destiny
+        ))
+
+    def _is_expired(self, updated_at: float, now: float) -> bool:
+        return bool(updated_at) and now - updated_at > self.ttl
+
+    async def _get_record(self, key: StorageKey) -> tuple:
+        """(состояние, данные в JSON) с учетом времени жизни."""
+        storage_key = self._key(key)
+        record = self._cache.get(storage_key)
+        if record is None:
+            record = await async_db.get_fsm_record(storage_key) or (None, None, 0.0)
+            self._cache.set(storage_key, record)
+        state, data, updated_at = record
+        if self._is_expired(updated_at, time.time()):
+            return None, None
+        return state, data
+
+    async def _update(self, key: StorageKey, field: str, value: Optional[str]) -> None:
+        """Изменение одного поля записи в базе и в кэше.
+
+        Поля меняются отдельно, поэтому одновременные set_state и set_data
+        не затирают друг друга.
+        """
+        storage_key = self._key(key)
+        now = time.time()
+        await async_db.update_fsm_record(storage_key, field, value, now, now - self.ttl)
+
+        cached = self._cache.get(storage_key)
+        if cached is None:
+            return
+        state, data, updated_at = cached
+        if self._is_expired(updated_at, now):
+            state, data = None, None
+        if field == "state":
+            state = value
+        else:
+            data = value
+        self._cache.set(storage_key, (state, data, now))
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        await self._update(key, "state", state.state if isinstance(state, State) else state)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        state, _ = await self._get_record(key)
+        return state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        # Пустые данные не хранятся, остальные - без лишних пробелов
+        encoded = json.dumps(dict(data), ensure_ascii=False, separators=(",", ":")) if data else None
+        await self._update(key, "data", encoded)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        _, data = await self._get_record(key)
+        # Каждый раз возвращается новый словарь, как в MemoryStorage
+        return json.loads(data) if data else {}
+
+    def start(self) -> None:
+        """Запуск периодического удаления устаревших состояний."""
+        if self._cleanup_task is None:
+            self._cleanup_task = asyncio.create_task(self._cleanup_loop())
+
+    async def close(self) -> None:
+        """Остановка удаления устаревших состояний."""
+        if self._cleanup_task is not None:
+            self._cleanup_task.cancel()
+            try:
+                await self._cleanup_task
+            except asyncio.CancelledError:
+                pass
+            self._cleanup_task = None
+
+    async def _cleanup_loop(self) -> None:
+        while True:
+            try:
+                deleted = await async_db.delete_expired_fsm_records(time.time() - self.ttl)
+                if deleted:
+                    logging.info(f"Удалено устаревших состояний FSM: {deleted}")
+            except Exception as e:
+                logging.error(f"Ошибка при удалении устаревших состояний FSM: {e}")
+            await asyncio.sleep(self.cleanup_interval)
@@ -0,0 +1,70 @@
+import asyncio
+from typing import Any, Awaitable, Dict, Hashable, Optional
+
+class GenerationCancelled(Exception):
+    """Генерация отменена пользователем или заменена новым запросом."""
+
+class _Generation:
+    def __init__(self, task: asyncio.Task, key: Optional[Hashable]):
+        self.task = task
+        self.key = key
+        self.cancelled = False
+
+class GenerationRegistry:
+    """Реестр выполняющихся генераций пользователей.
+
+    У каждого пользователя одновременно выполняется не больше одной
+    генерации: новый запрос или отмена прерывают предыдущую вместе с
+    запросом к API, поэтому ее результат не попадает в историю и статистику.
+    Повтор того же запроса не прерывает генерацию, а присоединяется к ней.
+    """
+
+    def __init__(self):
+        self._generations: Dict[int, _Generation] = {}
+
+    def __len__(self) -> int:
+        return len(self._generations)
+
+    def is_running(self, user_id: int) -> bool:
+        """Выполняется ли генерация пользователя."""
+        return user_id in self._generations
+
+    def cancel(self, user_id: int) -> bool:
+        """Отмена текущей генерации пользователя. Возвращает True, если она была."""
+        generation = self._generations.pop(user_id, None)
+        if generation is None or generation.task.done():
+            return False
+        generation.cancelled = True
+        generation.task.cancel()
+        return True
+
+    async def run(self, user_id: int, coro: Awaitable[Any], key: Optional[Hashable] = None) -> Any:
+        """Выполнение генерации с отменой предыдущей генерации пользователя.
+
+        Если предыдущая генерация еще выполняется с тем же ключом key,
+        повторный запрос не отменяет ее, а ждет ее результат.
+        Если генерация отменена через реестр, выбрасывается GenerationCancelled.
+        """
+        generation = self._generations.get(user_id)
+        if key is not None and generation is not None and generation.key == key and not generation.task.done():
+            # Повторно отправленный запрос присоединяется к выполняющемуся
+            if asyncio.iscoroutine(coro):
+                coro.close()
+            task = asyncio.shield(generation.task)
+        else:
+            self.cancel(user_id)
+            generation = _Generation(asyncio.ensure_future(coro), key)
+            self._generations[user_id] = generation
+            task = generation.task
+        try:
+            return await task
+        except asyncio.CancelledError:
+            if generation.cancelled:
+                raise GenerationCancelled() from None
+            raise
+        finally:
+            if self._generations.get(user_id) is generation:
+                del self._generations[user_id]
+
+# Создаем глобальный экземпляр реестра генераций
+generation_registry = GenerationRegistry()
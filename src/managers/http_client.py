@@ -0,0 +1,50 @@
+import logging
+from typing import Optional
+
+import aiohttp
+
+from config.config import (
+    HTTP_CONNECTION_LIMIT, HTTP_CONNECTION_LIMIT_PER_HOST, HTTP_KEEPALIVE_TIMEOUT,
+    HTTP_DNS_CACHE_TTL, HTTP_TOTAL_TIMEOUT, HTTP_CONNECT_TIMEOUT
+)
+
+class HttpClient:
+    """Общий HTTP клиент с долгоживущим пулом соединений."""
+
+    def __init__(self):
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def start(self) -> None:
+        """Создание сессии и пула соединений."""
+        if self._session is not None and not self._session.closed:
+            return
+
+        connector = aiohttp.TCPConnector(
+            limit=HTTP_CONNECTION_LIMIT,
+            limit_per_host=HTTP_CONNECTION_LIMIT_PER_HOST,
+            keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+            ttl_dns_cache=HTTP_DNS_CACHE_TTL,
+            use_dns_cache=True
+        )
+        timeout = aiohttp.ClientTimeout(
+            total=HTTP_TOTAL_TIMEOUT,
+            connect=HTTP_CONNECT_TIMEOUT
+        )
+        self._session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+        logging.info("HTTP клиент запущен")
+
+    async def close(self) -> None:
+        """Закрытие сессии и всех соединений пула."""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+            logging.info("HTTP клиент остановлен")
+        self._session = None
+
+    async def get_session(self) -> aiohttp.ClientSession:
+        """Получение общей сессии (создается при первом обращении)."""
+        if self._session is None or self._session.closed:
+            await self.start()
+        return self._session
+
+# Создаем глобальный экземпляр HTTP клиента
+http_client = HttpClient()
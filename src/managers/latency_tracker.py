@@ -0,0 +1,116 @@
+import bisect
+import math
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from config.config import (
+    LATENCY_WINDOW, LATENCY_EWMA_ALPHA, LATENCY_MIN_SAMPLES, HTTP_TOTAL_TIMEOUT,
+    ADAPTIVE_TIMEOUTS, ADAPTIVE_TIMEOUT_MULTIPLIER, ADAPTIVE_TIMEOUT_MIN
+)
+
+# Границы корзин гистограммы времени ответа (секунды)
+LATENCY_BUCKETS = (0.5, 1, 2, 5, 10, 20, 30, 60, 120)
+
+class ModelLatency:
+    """Время ответа одной модели: EWMA, гистограмма и окно последних запросов."""
+
+    def __init__(self, window: int):
+        self.samples: Deque[float] = deque(maxlen=window)
+        self.buckets: List[int] = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.ewma: Optional[float] = None
+        self.count = 0
+        self.timeouts = 0
+
+    def record(self, seconds: float, alpha: float) -> None:
+        self.samples.append(seconds)
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.ewma = seconds if self.ewma is None else alpha * seconds + (1 - alpha) * self.ewma
+        self.count += 1
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))]
+
+class LatencyTracker:
+    """Время ответа API по типам запросов и моделям.
+
+    EWMA реагирует на резкое замедление модели, перцентили считаются
+    по окну последних запросов, гистограмма накапливается за все время
+    работы и нужна для мониторинга.
+    """
+
+    def __init__(self, window: int = LATENCY_WINDOW, alpha: float = LATENCY_EWMA_ALPHA):
+        self.window = window
+        self.alpha = alpha
+        self._models: Dict[Tuple[str, str], ModelLatency] = {}
+
+    def _get(self, endpoint: str, model_name: str) -> ModelLatency:
+        key = (endpoint, model_name)
+        latency = self._models.get(key)
+        if latency is None:
+            latency = self._models[key] = ModelLatency(self.window)
+        return latency
+
+    def record(self, endpoint: str, model_name: str, seconds: float) -> None:
+        """Учет времени успешного запроса."""
+        self._get(endpoint, model_name).record(seconds, self.alpha)
+
+    def record_timeout(self, endpoint: str, model_name: str, seconds: float) -> None:
+        """Учет запроса, прерванного по таймауту: он входит в EWMA как минимум seconds."""
+        latency = self._get(endpoint, model_name)
+        latency.timeouts += 1
+        latency.record(seconds, self.alpha)
+
+    def count(self, endpoint: str, model_name: str) -> int:
+        """Количество учтенных запросов в окне."""
+        latency = self._models.get((endpoint, model_name))
+        return len(latency.samples) if latency else 0
+
+    def percentile(self, endpoint: str, model_name: str, q: float) -> Optional[float]:
+        """Перцентиль q (от 0 до 1) времени ответа или None, если данных нет."""
+        latency = self._models.get((endpoint, model_name))
+        return latency.percentile(q) if latency else None
+
+    def ewma(self, endpoint: str, model_name: str) -> Optional[float]:
+        """Экспоненциально сглаженное время ответа или None, если данных нет."""
+        latency = self._models.get((endpoint, model_name))
+        return latency.ewma if latency else None
+
+    def p50_by_model(self, endpoint: str) -> Dict[str, float]:
+        """Медиана недавнего времени ответа для всех моделей типа."""
+        return {
+            model_name: latency.percentile(0.5)
+            for (model_endpoint, model_name), latency in self._models.items()
+            if model_endpoint == endpoint and latency.samples
+        }
+
+    def timeout(self, endpoint: str, model_name: str) -> float:
+        """Таймаут запроса к модели.
+
+        Пока данных мало, используется HTTP_TOTAL_TIMEOUT; дальше -
+        p99 (или EWMA, если она больше) с запасом ADAPTIVE_TIMEOUT_MULTIPLIER.
+        """
+        if not ADAPTIVE_TIMEOUTS or self.count(endpoint, model_name) < LATENCY_MIN_SAMPLES:
+            return HTTP_TOTAL_TIMEOUT
+        latency = self._models[(endpoint, model_name)]
+        expected = max(latency.percentile(0.99), latency.ewma)
+        return min(HTTP_TOTAL_TIMEOUT, max(ADAPTIVE_TIMEOUT_MIN, expected * ADAPTIVE_TIMEOUT_MULTIPLIER))
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Время ответа всех моделей для мониторинга."""
+        return {
+            f"{endpoint}:{model_name}": {
+                "count": latency.count,
+                "timeouts": latency.timeouts,
+                "ewma": latency.ewma,
+                "p50": latency.percentile(0.5),
+                "p95": latency.percentile(0.95),
+                "buckets": dict(zip([*map(str, LATENCY_BUCKETS), "+Inf"], latency.buckets))
+            }
+            for (endpoint, model_name), latency in self._models.items()
+        }
+
+# Создаем глобальный экземпляр учета времени ответа
+latency_tracker = LatencyTracker()
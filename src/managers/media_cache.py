@@ -0,0 +1,173 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from config.config import MEDIA_CACHE_ENABLED, MEDIA_CACHE_DIR, MEDIA_CACHE_MAX_BYTES
+
+# Префикс подкаталогов рабочих процессов (режим WORKERS > 1)
+_PARTITION_PREFIX = "worker-"
+
+class MediaCache:
+    """Дисковый кэш сгенерированных файлов с адресацией по содержимому запроса.
+
+    Ключ - хэш параметров генерации. Размер кэша ограничен, при
+    переполнении удаляются давно не использованные файлы. Запись атомарна:
+    файл сначала пишется во временный, затем переименовывается.
+    """
+
+    def __init__(self, directory: str = MEDIA_CACHE_DIR, max_bytes: int = MEDIA_CACHE_MAX_BYTES,
+                 enabled: bool = MEDIA_CACHE_ENABLED):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._index: "OrderedDict[str, int]" = OrderedDict()
+        self._total_bytes = 0
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(kind: str, model: str, prompt: str, voice: Optional[str] = None, **params: Any) -> str:
+        """Ключ кэша по параметрам генерации."""
+        payload = {"kind": kind, "model": model, "prompt": prompt, "voice": voice, **params}
+        return hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+    def partition(self, index: int, count: int) -> None:
+        """Отдельный подкаталог и доля лимита размера для рабочего процесса index из count.
+
+        Индекс и лимит каждый процесс ведет сам, поэтому общий каталог
+        рабочих процессов привел бы к промахам и превышению лимита.
+        Вызывается до первого обращения к кэшу.
+        """
+        self.directory = os.path.join(self.directory, f"{_PARTITION_PREFIX}{index + 1}")
+        self.max_bytes //= count
+
+    def remove_stale_partitions(self, count: int) -> None:
+        """Удаление подкаталогов рабочих процессов с номером больше count."""
+        if not os.path.isdir(self.directory):
+            return
+        for name in os.listdir(self.directory):
+            number = name[len(_PARTITION_PREFIX):]
+            if name.startswith(_PARTITION_PREFIX) and number.isdigit() and int(number) > count:
+                shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key)
+
+    def _load_index(self) -> None:
+        """Восстановление индекса по файлам на диске (от старых к новым)."""
+        entries = []
+        os.makedirs(self.directory, exist_ok=True)
+        for shard in os.listdir(self.directory):
+            # Файлы лежат в подкаталогах из двух символов ключа; подкаталоги
+            # рабочих процессов к этому кэшу не относятся
+            shard_path = os.path.join(self.directory, shard)
+            if len(shard) != 2 or not os.path.isdir(shard_path):
+                continue
+            for name in os.listdir(shard_path):
+                if name.startswith("."):
+                    continue
+                stat = os.stat(os.path.join(shard_path, name))
+                entries.append((stat.st_mtime, name, stat.st_size))
+        for _, key, size in sorted(entries):
+            self._index[key] = size
+            self._total_bytes += size
+        self._loaded = True
+
+    def _read(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            if not self._loaded:
+                self._load_index()
+            if key not in self._index:
+                self.misses += 1
+                return None
+            self._index.move_to_end(key)
+
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            # Время изменения используется для восстановления порядка LRU после рестарта
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                self._forget(key)
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+        return data
+
+    def _write(self, key: str, data: bytes) -> None:
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        with self._lock:
+            if not self._loaded:
+                self._load_index()
+            self._forget(key)
+            self._index[key] = len(data)
+            self._total_bytes += len(data)
+            self._evict()
+
+    def _forget(self, key: str) -> None:
+        size = self._index.pop(key, None)
+        if size is not None:
+            self._total_bytes -= size
+
+    def _evict(self) -> None:
+        """Удаление самых давно использованных файлов сверх лимита."""
+        while self._total_bytes > self.max_bytes and self._index:
+            key, size = self._index.popitem(last=False)
+            self._total_bytes -= size
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    async def get(self, key: str) -> Optional[bytes]:
+        """Получение файла из кэша."""
+        if not self.enabled:
+            return None
+        return await asyncio.to_thread(self._read, key)
+
+    async def put(self, key: str, data: bytes) -> None:
+        """Сохранение файла в кэш."""
+        if not self.enabled or not data or len(data) > self.max_bytes:
+            return
+        try:
+            await asyncio.to_thread(self._write, key, data)
+        except OSError as e:
+            logging.error(f"Ошибка при записи в кэш медиа: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Статистика кэша."""
+        with self._lock:
+            return {
+                "files": len(self._index),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses
+            }
+
+# Создаем глобальный экземпляр кэша медиа
+media_cache = MediaCache()
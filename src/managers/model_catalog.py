@@ -0,0 +1,167 @@
+import asyncio
+import logging
+import random
+import time
+from typing import Dict, Any, List, Optional
+
+from config.config import (
+    MODEL_CATALOG_TTL, MODEL_CATALOG_REFRESH_INTERVAL, MODEL_CATALOG_REFRESH_JITTER,
+    MODEL_CATALOG_RETRY_INTERVAL, MODEL_CATALOG_WARMUP_TIMEOUT,
+    MODEL_FALLBACK, MODEL_DEGRADED_FACTOR, LATENCY_MIN_SAMPLES
+)
+from src.utils.pollinations import fetch_all_models
+from .async_database import async_db
+from .circuit_breaker import circuit_breakers
+from .latency_tracker import latency_tracker
+
+MODEL_TYPES = ("text", "image", "audio")
+
+class ModelCatalog:
+    """Общий для всех пользователей каталог моделей.
+
+    Каталог хранится в памяти и в базе данных и обновляется только в фоне:
+    при старте и затем по расписанию. Если API недоступен, отдается
+    последняя успешно загруженная копия.
+    """
+
+    def __init__(self, ttl: float = MODEL_CATALOG_TTL):
+        self.ttl = ttl
+        self.version = 0
+        self.updated_at = 0.0
+        self._models: Dict[str, List[Any]] = {}
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._schedule_task: Optional[asyncio.Task] = None
+
+    async def load(self) -> None:
+        """Загрузка сохраненного каталога из базы данных."""
+        stored = await async_db.get_model_catalog()
+        for model_type, entry in stored.items():
+            self._models[model_type] = entry["models"]
+            self.version = max(self.version, entry["version"])
+            self.updated_at = max(self.updated_at, entry["updated_at"])
+
+    def has(self, model_type: str) -> bool:
+        """Есть ли в каталоге модели указанного типа."""
+        return bool(self._models.get(model_type))
+
+    def is_stale(self) -> bool:
+        """Истекло ли время жизни каталога."""
+        return time.time() - self.updated_at > self.ttl
+
+    def get(self, model_type: str) -> Optional[List[Any]]:
+        """Получение списка моделей указанного типа без обращения к сети.
+
+        Если моделей нет или каталог устарел, запускается фоновое обновление.
+        """
+        if not self.has(model_type) or self.is_stale():
+            self.refresh_in_background()
+        return self._models.get(model_type)
+
+    def model_names(self, model_type: str) -> List[str]:
+        """Имена моделей указанного типа."""
+        models = self._models.get(model_type) or []
+        if model_type == "image":
+            return list(models)
+        names = [model.get("name") for model in models if model.get("name")]
+        if model_type == "text":
+            # Аудио модели приходят в общем списке текстовых
+            audio_names = set(self.model_names("audio"))
+            names = [name for name in names if name not in audio_names]
+        return names
+
+    def pick_model(self, model_type: str, model_name: str) -> str:
+        """Модель для запроса: выбранная или, при MODEL_FALLBACK, более быстрая того же типа.
+
+        Замена выбирается, если размыкатель выбранной модели открыт или ее
+        время ответа в MODEL_DEGRADED_FACTOR раз больше, чем у самой быстрой.
+        """
+        if not MODEL_FALLBACK:
+            return model_name
+        candidates = [
+            name for name in self.model_names(model_type)
+            if name != model_name
+            and circuit_breakers.is_closed(model_type, name)
+            and latency_tracker.count(model_type, name) >= LATENCY_MIN_SAMPLES
+        ]
+        if not candidates:
+            return model_name
+        fastest = min(candidates, key=lambda name: latency_tracker.ewma(model_type, name))
+        current = latency_tracker.ewma(model_type, model_name)
+        fastest_latency = latency_tracker.ewma(model_type, fastest)
+        if not circuit_breakers.is_closed(model_type, model_name) or (
+            current is not None and current > MODEL_DEGRADED_FACTOR * fastest_latency
+        ):
+            logging.info(f"Модель {model_name} ({model_type}) деградировала, используется {fastest}")
+            return fastest
+        return model_name
+
+    def refresh_in_background(self) -> None:
+        """Запуск фонового обновления, если оно еще не запущено."""
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self.refresh())
+
+    async def refresh(self) -> bool:
+        """Загрузка каталога из API и сохранение его в базу.
+
+        Возвращает True, если удалось получить модели всех типов.
+        """
+        text_models, image_models, audio_models = await fetch_all_models()
+        fetched = {"text": text_models, "image": image_models, "audio": audio_models}
+        fetched = {model_type: models for model_type, models in fetched.items() if models}
+        if not fetched:
+            logging.warning("Не удалось обновить каталог моделей, используется сохраненная копия")
+            return False
+
+        now = time.time()
+        changed = any(self._models.get(model_type) != models for model_type, models in fetched.items())
+        if changed:
+            self.version += 1
+        self._models.update(fetched)
+        self.updated_at = now
+
+        await async_db.save_model_catalog({
+            model_type: {"models": models, "version": self.version, "updated_at": now}
+            for model_type, models in self._models.items()
+        })
+        return len(fetched) == len(MODEL_TYPES)
+
+    async def start(self) -> None:
+        """Загрузка сохраненного каталога, прогрев и запуск планового обновления."""
+        await self.load()
+        if not all(self.has(model_type) for model_type in MODEL_TYPES) or self.is_stale():
+            # Обновление идет отдельной задачей: по таймауту прекращается только ожидание
+            self.refresh_in_background()
+            try:
+                await asyncio.wait_for(asyncio.shield(self._refresh_task), MODEL_CATALOG_WARMUP_TIMEOUT)
+            except asyncio.TimeoutError:
+                logging.warning("Каталог моделей не загрузился при старте, обновление продолжится в фоне")
+        if self._schedule_task is None:
+            self._schedule_task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self) -> None:
+        """Остановка планового и фонового обновления."""
+        for task in (self._schedule_task, self._refresh_task):
+            if task is not None and not task.done():
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._schedule_task = None
+        self._refresh_task = None
+
+    async def _refresh_loop(self) -> None:
+        complete = all(self.has(model_type) for model_type in MODEL_TYPES)
+        while True:
+            interval = MODEL_CATALOG_REFRESH_INTERVAL if complete else MODEL_CATALOG_RETRY_INTERVAL
+            # Разброс не дает нескольким процессам обновляться одновременно
+            jitter = interval * MODEL_CATALOG_REFRESH_JITTER
+            await asyncio.sleep(interval + random.uniform(-jitter, jitter))
+            try:
+                complete = await self.refresh()
+            except Exception as e:
+                logging.error(f"Ошибка при обновлении каталога моделей: {e}")
+                complete = False
+
+# Создаем глобальный экземпляр каталога моделей
+model_catalog = ModelCatalog()
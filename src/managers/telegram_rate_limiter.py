@@ -0,0 +1,210 @@
+import asyncio
+import bisect
+import itertools
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import Response, TelegramMethod
+
+from config.config import (
+    TELEGRAM_GLOBAL_RATE, TELEGRAM_GLOBAL_BURST, TELEGRAM_CHAT_RATE, TELEGRAM_CHAT_BURST,
+    TELEGRAM_MAX_RETRIES
+)
+
+# Приоритеты отправки: меньше - раньше
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+
+# Результаты генерации отправляются раньше остальных сообщений
+_HIGH_PRIORITY_METHODS = {"sendPhoto", "sendAudio", "sendDocument", "sendVoice", "sendVideo", "sendMediaGroup"}
+# Ограничиваются только методы, отправляющие или изменяющие сообщения в чате
+_LIMITED_PREFIXES = ("send", "edit", "copy", "forward")
+# Количество корзин чатов, после которого удаляются неиспользуемые
+_CHAT_BUCKETS_CLEANUP_SIZE = 10000
+
+_send_priority: ContextVar[Optional[int]] = ContextVar("send_priority", default=None)
+
+@contextmanager
+def send_priority(priority: int):
+    """Приоритет сообщений, отправляемых внутри блока."""
+    token = _send_priority.set(priority)
+    try:
+        yield
+    finally:
+        _send_priority.reset(token)
+
+class TokenBucket:
+    """Корзина токенов: rate токенов в секунду, не больше capacity."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def wait_time(self, now: float) -> float:
+        """Через сколько секунд будет доступен токен."""
+        self._refill(now)
+        wait = max(0.0, (1 - self.tokens) / self.rate)
+        return max(wait, self.paused_until - now)
+
+    def take(self, now: float) -> None:
+        self._refill(now)
+        self.tokens -= 1
+
+    def pause(self, seconds: float) -> None:
+        """Остановка выдачи токенов (после ответа Telegram "retry after")."""
+        now = time.monotonic()
+        self.paused_until = max(self.paused_until, now + seconds)
+        self._refill(now)
+        self.tokens = min(self.tokens, 0)
+
+    def is_idle(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity and self.paused_until <= now
+
+class _Waiter:
+    def __init__(self, priority: int, seq: int, chat_id: Any):
+        self.priority = priority
+        self.seq = seq
+        self.chat_id = chat_id
+        self.future = asyncio.get_running_loop().create_future()
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+class TelegramRateLimiter(BaseRequestMiddleware):
+    """Ограничение исходящих запросов к Telegram.
+
+    Подключается как middleware сессии бота, поэтому действует на все
+    вызовы message.answer, edit_text, answer_photo и т.д. Сообщения
+    выдаются по общей корзине токенов и корзине каждого чата в порядке
+    приоритета; при ответе "retry after" чат приостанавливается и запрос
+    повторяется.
+    """
+
+    def __init__(self, global_rate: float = TELEGRAM_GLOBAL_RATE, global_burst: float = TELEGRAM_GLOBAL_BURST,
+                 chat_rate: float = TELEGRAM_CHAT_RATE, chat_burst: float = TELEGRAM_CHAT_BURST,
+                 max_retries: int = TELEGRAM_MAX_RETRIES):
+        self.global_bucket = TokenBucket(global_rate, global_burst)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.retries = 0
+        self._chat_buckets: Dict[Any, TokenBucket] = {}
+        self._waiters: List[_Waiter] = []
+        self._seq = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def scale(self, parts: int) -> None:
+        """Деление общего лимита между parts процессами."""
+        self.global_bucket.rate /= parts
+        self.global_bucket.capacity = max(1.0, self.global_bucket.capacity / parts)
+        self.global_bucket.tokens = min(self.global_bucket.tokens, self.global_bucket.capacity)
+
+    def _chat_bucket(self, chat_id: Any) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) >= _CHAT_BUCKETS_CLEANUP_SIZE:
+                now = time.monotonic()
+                self._chat_buckets = {
+                    key: value for key, value in self._chat_buckets.items() if not value.is_idle(now)
+                }
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket
+
+    async def acquire(self, chat_id: Any, priority: int = PRIORITY_NORMAL) -> None:
+        """Ожидание разрешения на отправку в чат."""
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._dispatch_loop())
+        waiter = _Waiter(priority, next(self._seq), chat_id)
+        bisect.insort(self._waiters, waiter)
+        self._wakeup.set()
+        await waiter.future
+
+    def pause(self, chat_id: Any, seconds: float) -> None:
+        """Приостановка отправки в чат (или всех отправок, если чат неизвестен)."""
+        bucket = self.global_bucket if chat_id is None else self._chat_bucket(chat_id)
+        bucket.pause(seconds)
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _dispatch_loop(self) -> None:
+        while True:
+            self._wakeup.clear()
+            now = time.monotonic()
+            self._waiters = [waiter for waiter in self._waiters if not waiter.future.done()]
+            if not self._waiters:
+                await self._wakeup.wait()
+                continue
+
+            timeout = self.global_bucket.wait_time(now)
+            if timeout <= 0:
+                timeout = None
+                for waiter in self._waiters:
+                    wait = self._chat_bucket(waiter.chat_id).wait_time(now)
+                    if wait <= 0:
+                        # Первый по приоритету запрос, чат которого свободен
+                        self._waiters.remove(waiter)
+                        self.global_bucket.take(now)
+                        self._chat_bucket(waiter.chat_id).take(now)
+                        waiter.future.set_result(None)
+                        break
+                    timeout = wait if timeout is None else min(timeout, wait)
+                else:
+                    # Все чаты ожидают; новый запрос может прийти в свободный чат
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout)
+                    except asyncio.TimeoutError:
+                        pass
+                continue
+            await asyncio.sleep(timeout)
+
+    @staticmethod
+    def _priority(method: TelegramMethod) -> int:
+        priority = _send_priority.get()
+        if priority is not None:
+            return priority
+        return PRIORITY_HIGH if method.__api_method__ in _HIGH_PRIORITY_METHODS else PRIORITY_NORMAL
+
+    async def __call__(self, make_request: NextRequestMiddlewareType, bot: Bot, method: TelegramMethod) -> Response:
+        if not method.__api_method__.startswith(_LIMITED_PREFIXES):
+            return await make_request(bot, method)
+
+        chat_id = getattr(method, "chat_id", None)
+        priority = self._priority(method)
+        for attempt in range(self.max_retries + 1):
+            await self.acquire(chat_id, priority)
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                if attempt == self.max_retries:
+                    raise
+                self.retries += 1
+                logging.warning(f"Telegram просит подождать {e.retry_after} с ({method.__api_method__}, чат {chat_id})")
+                self.pause(chat_id, e.retry_after)
+
+    def stats(self) -> Dict[str, Any]:
+        """Состояние очереди отправки."""
+        return {
+            "queued": sum(1 for waiter in self._waiters if not waiter.future.done()),
+            "chats": len(self._chat_buckets),
+            "retries": self.retries
+        }
+
+# Создаем глобальный экземпляр ограничителя отправки
+telegram_rate_limiter = TelegramRateLimiter()
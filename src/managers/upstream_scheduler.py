@@ -0,0 +1,201 @@
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+from config.config import (
+    UPSTREAM_TEXT_CONCURRENCY, UPSTREAM_IMAGE_CONCURRENCY, UPSTREAM_AUDIO_CONCURRENCY,
+    UPSTREAM_PER_USER_CONCURRENCY
+)
+
+QueueCallback = Callable[[int], Awaitable[None]]
+
+# Пользователь, от имени которого выполняются запросы в текущей задаче,
+# и обработчик изменения его позиции в очереди
+_requester: ContextVar[Tuple[Optional[int], Optional[QueueCallback]]] = ContextVar(
+    "upstream_requester", default=(None, None)
+)
+
+# Значение last_user до первой выдачи места (None - допустимый пользователь)
+_NO_USER = object()
+
+class _Waiter:
+    def __init__(self, user_id: Optional[int], on_queue: Optional[QueueCallback]):
+        self.future = asyncio.get_running_loop().create_future()
+        self.user_id = user_id
+        self.on_queue = on_queue
+        self.position = 0
+
+class _Endpoint:
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.active = 0
+        # Очереди ожидающих по пользователям; порядок ключей - порядок обхода
+        self.queues: "OrderedDict[Optional[int], Deque[_Waiter]]" = OrderedDict()
+        # Пользователь, получивший место последним (в том числе без ожидания)
+        self.last_user: object = _NO_USER
+
+class UpstreamScheduler:
+    """Планировщик запросов к API с глобальными и пользовательскими ограничениями.
+
+    Для каждого типа запросов действует свой лимит одновременных запросов,
+    для каждого пользователя - общий лимит. Свободные места раздаются
+    пользователям по кругу, поэтому один активный пользователь не может
+    занять всю очередь.
+    """
+
+    def __init__(self, limits: Dict[str, int], per_user_limit: int):
+        self.per_user_limit = per_user_limit
+        self._endpoints = {name: _Endpoint(limit) for name, limit in limits.items()}
+        self._user_active: Dict[Optional[int], int] = {}
+        self._notify_tasks = set()
+
+    @contextmanager
+    def requester(self, user_id: int, on_queue: Optional[QueueCallback] = None):
+        """Привязка запросов внутри блока к пользователю."""
+        token = _requester.set((user_id, on_queue))
+        try:
+            yield
+        finally:
+            _requester.reset(token)
+
+    @asynccontextmanager
+    async def slot(self, endpoint: str):
+        """Ожидание места для запроса указанного типа."""
+        user_id = await self._acquire(endpoint)
+        try:
+            yield
+        finally:
+            self._release(endpoint, user_id)
+
+    def scale(self, parts: int) -> None:
+        """Деление общих лимитов между parts процессами (каждому не меньше одного места)."""
+        for endpoint in self._endpoints.values():
+            endpoint.limit = max(1, -(-endpoint.limit // parts))
+
+    def queue_length(self, endpoint: str) -> int:
+        """Количество запросов, ожидающих в очереди."""
+        return sum(len(queue) for queue in self._endpoints[endpoint].queues.values())
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Состояние очередей по типам запросов."""
+        return {
+            name: {"active": endpoint.active, "limit": endpoint.limit, "queued": self.queue_length(name)}
+            for name, endpoint in self._endpoints.items()
+        }
+
+    async def _acquire(self, endpoint_name: str) -> Optional[int]:
+        user_id, on_queue = _requester.get()
+        endpoint = self._endpoints[endpoint_name]
+        waiter = _Waiter(user_id, on_queue)
+        endpoint.queues.setdefault(user_id, deque()).append(waiter)
+        self._dispatch(endpoint)
+        if not waiter.future.done():
+            self._notify_positions(endpoint)
+
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Место уже выдано, но задача отменена - возвращаем его
+                self._release(endpoint_name, user_id)
+            else:
+                self._remove_waiter(endpoint, waiter)
+            raise
+
+        if waiter.position and on_queue:
+            # Сообщаем о выходе из очереди
+            await self._call(on_queue, 0)
+        return user_id
+
+    def _release(self, endpoint_name: str, user_id: Optional[int]) -> None:
+        self._endpoints[endpoint_name].active -= 1
+        self._user_active[user_id] -= 1
+        if not self._user_active[user_id]:
+            del self._user_active[user_id]
+        # Освободилось место пользователя, поэтому проверяем все очереди
+        for endpoint in self._endpoints.values():
+            self._dispatch(endpoint)
+
+    def _can_run(self, user_id: Optional[int]) -> bool:
+        # Запросы без привязки к пользователю ограничены только общим лимитом
+        if user_id is None:
+            return True
+        return self._user_active.get(user_id, 0) < self.per_user_limit
+
+    def _dispatch(self, endpoint: _Endpoint) -> None:
+        """Выдача свободных мест ожидающим пользователям по кругу."""
+        dispatched = False
+        while endpoint.active < endpoint.limit:
+            eligible = [uid for uid in endpoint.queues if self._can_run(uid)]
+            if not eligible:
+                break
+            user_id = eligible[0]
+            if user_id == endpoint.last_user and len(eligible) > 1:
+                # Пользователь только что получил место - сначала обслуживаем остальных
+                endpoint.queues.move_to_end(user_id)
+                continue
+            queue = endpoint.queues[user_id]
+            waiter = queue.popleft()
+            if queue:
+                # Пользователь переходит в конец круга
+                endpoint.queues.move_to_end(user_id)
+            else:
+                del endpoint.queues[user_id]
+            if waiter.future.done():
+                continue
+            endpoint.active += 1
+            endpoint.last_user = user_id
+            self._user_active[user_id] = self._user_active.get(user_id, 0) + 1
+            waiter.future.set_result(None)
+            dispatched = True
+        if dispatched:
+            self._notify_positions(endpoint)
+
+    def _remove_waiter(self, endpoint: _Endpoint, waiter: _Waiter) -> None:
+        queue = endpoint.queues.get(waiter.user_id)
+        if queue and waiter in queue:
+            queue.remove(waiter)
+            if not queue:
+                del endpoint.queues[waiter.user_id]
+            self._notify_positions(endpoint)
+
+    def _queue_order(self, endpoint: _Endpoint) -> List[_Waiter]:
+        """Порядок, в котором ожидающие получат места при обходе по кругу."""
+        queues = [list(queue) for queue in endpoint.queues.values()]
+        if len(queues) > 1 and next(iter(endpoint.queues)) == endpoint.last_user:
+            # Последний получивший место пользователь обслуживается после остальных
+            queues.append(queues.pop(0))
+        order = []
+        depth = 0
+        while any(depth < len(queue) for queue in queues):
+            order.extend(queue[depth] for queue in queues if depth < len(queue))
+            depth += 1
+        return order
+
+    def _notify_positions(self, endpoint: _Endpoint) -> None:
+        for position, waiter in enumerate(self._queue_order(endpoint), start=1):
+            if waiter.position != position and waiter.on_queue:
+                waiter.position = position
+                task = asyncio.create_task(self._call(waiter.on_queue, position))
+                self._notify_tasks.add(task)
+                task.add_done_callback(self._notify_tasks.discard)
+
+    @staticmethod
+    async def _call(callback: QueueCallback, position: int) -> None:
+        try:
+            await callback(position)
+        except Exception as e:
+            logging.warning(f"Ошибка при обновлении позиции в очереди: {e}")
+
+# Создаем глобальный экземпляр планировщика запросов к API
+upstream_scheduler = UpstreamScheduler(
+    limits={
+        "text": UPSTREAM_TEXT_CONCURRENCY,
+        "image": UPSTREAM_IMAGE_CONCURRENCY,
+        "audio": UPSTREAM_AUDIO_CONCURRENCY
+    },
+    per_user_limit=UPSTREAM_PER_USER_CONCURRENCY
+)
@@ -0,0 +1,99 @@
+import asyncio
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, Any, Optional
+
+from config.config import USAGE_FLUSH_INTERVAL_MS
+from .async_database import async_db
+
+USAGE_COUNTERS = ("images_generated", "texts_generated", "audio_generated")
+
+class UsageCounter:
+    """Буфер счетчиков использования с отложенной записью.
+
+    Увеличения счетчиков накапливаются в памяти и периодически
+    сбрасываются в базу одной транзакцией с атомарным инкрементом.
+    Чтение статистики и сброс буфера выполняются в потоке базы данных,
+    поэтому непримененные увеличения не теряются и не учитываются дважды.
+    """
+
+    def __init__(self, flush_interval_ms: int = USAGE_FLUSH_INTERVAL_MS):
+        self.flush_interval = flush_interval_ms / 1000
+        self._pending: Dict[int, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def increment(self, user_id: int, counter: str, amount: int = 1) -> None:
+        """Увеличение счетчика пользователя и отметка времени использования."""
+        if counter not in USAGE_COUNTERS:
+            raise ValueError(f"Неизвестный счетчик: {counter}")
+        with self._lock:
+            pending = self._pending.setdefault(user_id, {})
+            pending[counter] = pending.get(counter, 0) + amount
+            pending["last_used"] = datetime.now()
+
+    def _read_stats(self, user_id: int) -> Dict[str, Any]:
+        """Чтение статистики из базы с учетом незаписанных увеличений."""
+        stats = async_db.db.get_user_stats(user_id)
+        with self._lock:
+            pending = self._pending.get(user_id)
+            if pending:
+                for counter in USAGE_COUNTERS:
+                    stats[counter] = (stats.get(counter) or 0) + pending.get(counter, 0)
+                stats["last_used"] = pending["last_used"]
+        return stats
+
+    def _write_pending(self) -> None:
+        """Запись накопленных увеличений в базу данных."""
+        with self._lock:
+            batch, self._pending = self._pending, {}
+        if not batch:
+            return
+        try:
+            async_db.db.increment_usage(batch)
+        except Exception:
+            # Возвращаем неудавшуюся порцию в буфер, чтобы не потерять увеличения
+            with self._lock:
+                for user_id, counters in batch.items():
+                    pending = self._pending.setdefault(user_id, {})
+                    for counter in USAGE_COUNTERS:
+                        if counter in counters:
+                            pending[counter] = pending.get(counter, 0) + counters[counter]
+                    pending.setdefault("last_used", counters["last_used"])
+            raise
+
+    async def get_user_stats(self, user_id: int) -> Dict[str, Any]:
+        """Получение статистики пользователя с учетом буфера."""
+        return await async_db.run(self._read_stats, user_id)
+
+    async def flush(self) -> None:
+        """Сброс буфера счетчиков в базу данных."""
+        try:
+            await async_db.run(self._write_pending)
+        except Exception as e:
+            logging.error(f"Ошибка при записи счетчиков использования: {e}")
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def start(self) -> None:
+        """Запуск периодической записи счетчиков."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self) -> None:
+        """Остановка периодической записи и сброс остатка буфера."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+# Создаем глобальный экземпляр буфера счетчиков
+usage_counter = UsageCounter()
@@ -0,0 +1,3 @@
+"""
+Пакет с HTTP сервером бота: вебхук, проверка состояния и метрики.
+"""
@@ -0,0 +1,194 @@
+import asyncio
+import hmac
+import logging
+import secrets
+import signal
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Optional, Set
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from aiohttp import web
+
+from config.config import (
+    WEBHOOK_BASE_URL, WEBHOOK_PATH, WEBHOOK_SECRET, WEBHOOK_MAX_CONCURRENCY,
+    SERVER_HOST, SERVER_PORT
+)
+from src.managers.circuit_breaker import circuit_breakers
+from src.managers.generation_registry import generation_registry
+from src.managers.latency_tracker import latency_tracker
+from src.managers.media_cache import media_cache
+from src.managers.telegram_rate_limiter import telegram_rate_limiter
+from src.managers.upstream_scheduler import upstream_scheduler
+from src.utils.user_data import get_user_cache_stats
+
+# Время ожидания обработки уже принятых обновлений при остановке (секунды)
+SHUTDOWN_TIMEOUT = 30
+# Секрет вебхука проверяется всегда; если он не задан, при запуске генерируется
+# случайный и передается Telegram в set_webhook
+_webhook_secret = WEBHOOK_SECRET or secrets.token_urlsafe(32)
+
+@contextmanager
+def stop_on_signals():
+    """Событие остановки, которое устанавливается при SIGTERM или SIGINT.
+
+    Внутри блока сигналы не прерывают процесс, а только устанавливают
+    событие; после выхода из блока восстанавливаются обработчики по
+    умолчанию, поэтому повторный сигнал во время остановки ее прерывает.
+    """
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    installed = []
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+            installed.append(sig)
+        except (NotImplementedError, RuntimeError):
+            # Обработчики сигналов в цикле событий недоступны (Windows, не главный поток)
+            pass
+    try:
+        yield stop
+    finally:
+        for sig in installed:
+            loop.remove_signal_handler(sig)
+
+class UpdateProcessor:
+    """Фоновая обработка обновлений с ограничением одновременных обработчиков.
+
+    Вебхук сразу отвечает Telegram 200, а обновление обрабатывается в
+    отдельной задаче; одновременно выполняется не больше max_concurrency
+    обработчиков, остальные ждут своей очереди.
+    """
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, max_concurrency: int = WEBHOOK_MAX_CONCURRENCY):
+        self.dispatcher = dispatcher
+        self.bot = bot
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._tasks: Set[asyncio.Task] = set()
+        self.received = 0
+        self.processed = 0
+        self.failed = 0
+        self.active = 0
+
+    def submit(self, update: Update) -> None:
+        """Постановка обновления в обработку."""
+        self.received += 1
+        task = asyncio.create_task(self._process(update))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _process(self, update: Update) -> None:
+        async with self._semaphore:
+            self.active += 1
+            try:
+                await self.dispatcher.feed_update(self.bot, update)
+                self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                logging.error(f"Ошибка при обработке обновления {update.update_id}: {e}")
+            finally:
+                self.active -= 1
+
+    async def wait_closed(self, timeout: float = SHUTDOWN_TIMEOUT) -> None:
+        """Ожидание обработки уже принятых обновлений."""
+        if self._tasks:
+            await asyncio.wait(set(self._tasks), timeout=timeout)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "received": self.received,
+            "processed": self.processed,
+            "failed": self.failed,
+            "active": self.active,
+            "pending": len(self._tasks) - self.active
+        }
+
+def collect_metrics(processor: Optional[UpdateProcessor] = None, local_stats: bool = True) -> Dict[str, Any]:
+    """Метрики бота для мониторинга.
+
+    local_stats=False - только статистика обновлений: в процессе-приемнике
+    при WORKERS > 1 запросы к API и отправка не выполняются, и его очереди,
+    кэши и размыкатели всегда пусты.
+    """
+    metrics = {}
+    if local_stats:
+        metrics.update({
+            "upstream": upstream_scheduler.stats(),
+            "telegram": telegram_rate_limiter.stats(),
+            "circuit_breakers": circuit_breakers.stats(),
+            "latency": latency_tracker.stats(),
+            "media_cache": media_cache.stats(),
+            "user_cache": get_user_cache_stats(),
+            "active_generations": len(generation_registry)
+        })
+    if processor is not None:
+        metrics["updates"] = processor.stats()
+    return metrics
+
+def create_app(processor: Optional[UpdateProcessor] = None, webhook_route: bool = True,
+               local_stats: bool = True) -> web.Application:
+    """HTTP приложение с маршрутами /health и /metrics и, если задан processor, вебхуком."""
+    app = web.Application()
+    started_at = time.time()
+
+    async def health(request: web.Request) -> web.Response:
+        return web.json_response({"status": "ok", "uptime": round(time.time() - started_at)})
+
+    async def metrics(request: web.Request) -> web.Response:
+        return web.json_response(collect_metrics(processor, local_stats))
+
+    async def webhook(request: web.Request) -> web.Response:
+        token = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+        if not hmac.compare_digest(token.encode(), _webhook_secret.encode()):
+            return web.Response(status=401)
+        try:
+            update = Update.model_validate(await request.json(), context={"bot": processor.bot})
+        except ValueError as e:
+            logging.warning(f"Некорректное обновление в вебхуке: {e}")
+            return web.Response(status=400)
+        # Отвечаем сразу, обработка идет в фоне
+        processor.submit(update)
+        return web.Response()
+
+    app.router.add_get("/health", health)
+    app.router.add_get("/metrics", metrics)
+    if processor is not None and webhook_route:
+        app.router.add_post(WEBHOOK_PATH, webhook)
+    return app
+
+async def serve(app: web.Application, host: str, port: int) -> web.AppRunner:
+    """Запуск HTTP сервера; возвращает runner для остановки."""
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logging.info(f"HTTP сервер запущен на {host}:{port}")
+    return runner
+
+async def set_webhook(dispatcher: Dispatcher, bot: Bot) -> None:
+    """Регистрация вебхука в Telegram."""
+    if not WEBHOOK_BASE_URL:
+        raise RuntimeError("Для режима webhook нужно указать WEBHOOK_BASE_URL")
+    await bot.set_webhook(
+        WEBHOOK_BASE_URL.rstrip("/") + WEBHOOK_PATH,
+        secret_token=_webhook_secret,
+        allowed_updates=dispatcher.resolve_used_update_types(),
+        max_connections=min(100, WEBHOOK_MAX_CONCURRENCY)
+    )
+
+async def run_webhook(dispatcher: Dispatcher, bot: Bot) -> None:
+    """Работа бота в режиме вебхука до SIGTERM или SIGINT."""
+    processor = UpdateProcessor(dispatcher, bot)
+    await dispatcher.emit_startup(bot=bot)
+    runner = await serve(create_app(processor), SERVER_HOST, SERVER_PORT)
+    try:
+        with stop_on_signals() as stop:
+            await set_webhook(dispatcher, bot)
+            await stop.wait()
+        logging.info("Получен сигнал остановки")
+    finally:
+        # Вебхук не удаляем: Telegram придержит обновления до перезапуска
+        await runner.cleanup()
+        await processor.wait_closed()
+        await dispatcher.emit_shutdown(bot=bot)
+        await bot.session.close()
@@ -0,0 +1,171 @@
+import asyncio
+import logging
+import multiprocessing
+import queue
+from typing import Callable, Dict, List, Optional
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+
+from config.config import BOT_MODE, SERVER_HOST, SERVER_PORT, MONITORING_PORT, WEBHOOK_MAX_CONCURRENCY
+from src.managers.media_cache import media_cache
+from src.managers.upstream_scheduler import upstream_scheduler
+from src.managers.telegram_rate_limiter import telegram_rate_limiter
+from .webhook import UpdateProcessor, create_app, serve, set_webhook, stop_on_signals
+
+# Таймаут long polling запроса getUpdates (секунды)
+POLLING_TIMEOUT = 30
+# Как часто рабочий процесс проверяет очередь, пока она пуста (секунды)
+QUEUE_POLL_INTERVAL = 1.0
+
+def partition_key(update: Update) -> int:
+    """Ключ распределения обновления: пользователь, иначе чат, иначе само обновление."""
+    event = update.event
+    user = getattr(event, "from_user", None)
+    if user is not None:
+        return user.id
+    chat = getattr(event, "chat", None)
+    if chat is None and getattr(event, "message", None) is not None:
+        chat = event.message.chat
+    if chat is not None:
+        return chat.id
+    return update.update_id
+
+class UpdateDistributor:
+    """Распределение обновлений по рабочим процессам.
+
+    Обновления одного пользователя всегда попадают в один процесс, поэтому
+    сохраняется их порядок, а кэши состояний FSM и реестр генераций
+    остаются согласованными.
+    """
+
+    def __init__(self, bot: Bot, queues: List[multiprocessing.Queue]):
+        self.bot = bot
+        self.queues = queues
+        self.received = 0
+        self.per_worker = [0] * len(queues)
+
+    def submit(self, update: Update) -> None:
+        worker = partition_key(update) % len(self.queues)
+        self.received += 1
+        self.per_worker[worker] += 1
+        self.queues[worker].put(update.model_dump_json(exclude_unset=True))
+
+    async def wait_closed(self) -> None:
+        """Обновления обрабатываются в рабочих процессах, ждать в приемнике нечего."""
+
+    def stats(self) -> Dict[str, object]:
+        return {"received": self.received, "per_worker": list(self.per_worker)}
+
+def _next_update(updates: multiprocessing.Queue) -> Optional[str]:
+    try:
+        return updates.get(timeout=QUEUE_POLL_INTERVAL)
+    except queue.Empty:
+        return ""
+
+async def run_worker(dispatcher: Dispatcher, bot: Bot, updates: multiprocessing.Queue,
+                     index: int, count: int) -> None:
+    """Обработка обновлений из очереди в рабочем процессе до получения None."""
+    # Ограничения запросов к API и отправки в Telegram делятся между процессами
+    upstream_scheduler.scale(count)
+    telegram_rate_limiter.scale(count)
+    # Кэш медиа у каждого процесса в своем подкаталоге
+    media_cache.partition(index, count)
+    processor = UpdateProcessor(dispatcher, bot, max(1, WEBHOOK_MAX_CONCURRENCY // count))
+    loop = asyncio.get_running_loop()
+    parent = multiprocessing.parent_process()
+    await dispatcher.emit_startup(bot=bot)
+    logging.info(f"Рабочий процесс {index + 1}/{count} запущен")
+    try:
+        # По сигналу процесс дорабатывает уже полученные обновления и завершается,
+        # как только очередь опустеет; так же - если приемник завершился аварийно
+        with stop_on_signals() as stop:
+            while True:
+                raw_update = await loop.run_in_executor(None, _next_update, updates)
+                if raw_update is None:
+                    break
+                if raw_update:
+                    processor.submit(Update.model_validate_json(raw_update, context={"bot": bot}))
+                elif stop.is_set() or (parent is not None and not parent.is_alive()):
+                    break
+    finally:
+        await processor.wait_closed()
+        await dispatcher.emit_shutdown(bot=bot)
+        await bot.session.close()
+
+def start_workers(target: Callable, count: int) -> tuple:
+    """Запуск рабочих процессов target(index, count, queue); возвращает (процессы, очереди).
+
+    Процессы запускаются через spawn: каждый открывает собственные
+    соединения с базой данных и API.
+    """
+    context = multiprocessing.get_context("spawn")
+    queues = [context.Queue() for _ in range(count)]
+    processes = [
+        context.Process(target=target, args=(index, count, queues[index]), name=f"worker-{index + 1}")
+        for index in range(count)
+    ]
+    for process in processes:
+        process.start()
+    return processes, queues
+
+async def stop_workers(processes: list, queues: list) -> None:
+    """Остановка рабочих процессов после обработки уже отправленных обновлений."""
+    for updates in queues:
+        updates.put(None)
+    loop = asyncio.get_running_loop()
+    for process in processes:
+        await loop.run_in_executor(None, process.join)
+
+async def _poll_updates(dispatcher: Dispatcher, bot: Bot, distributor: UpdateDistributor) -> None:
+    """Получение обновлений через getUpdates без их обработки."""
+    await bot.delete_webhook()
+    allowed_updates = dispatcher.resolve_used_update_types()
+    offset = None
+    while True:
+        try:
+            updates = await bot.get_updates(offset=offset, timeout=POLLING_TIMEOUT, allowed_updates=allowed_updates)
+        except Exception as e:
+            logging.error(f"Ошибка при получении обновлений: {e}")
+            await asyncio.sleep(1)
+            continue
+        for update in updates:
+            distributor.submit(update)
+            offset = update.update_id + 1
+
+async def _run_until_stopped(coro, stop: asyncio.Event) -> None:
+    """Выполнение coro до его завершения или установки stop."""
+    task = asyncio.create_task(coro)
+    stopped = asyncio.create_task(stop.wait())
+    try:
+        await asyncio.wait({task, stopped}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        stopped.cancel()
+        if not task.done():
+            task.cancel()
+            await asyncio.wait({task})
+    if not task.cancelled():
+        task.result()
+
+async def run_ingress(dispatcher: Dispatcher, bot: Bot, target: Callable, count: int) -> None:
+    """Работа приемника до SIGTERM или SIGINT: получение обновлений и передача их count рабочим процессам."""
+    processes, queues = start_workers(target, count)
+    distributor = UpdateDistributor(bot, queues)
+    runner = None
+    try:
+        with stop_on_signals() as stop:
+            if BOT_MODE == "webhook":
+                runner = await serve(create_app(distributor, local_stats=False), SERVER_HOST, SERVER_PORT)
+                await set_webhook(dispatcher, bot)
+                await stop.wait()
+            else:
+                if MONITORING_PORT:
+                    app = create_app(distributor, webhook_route=False, local_stats=False)
+                    runner = await serve(app, SERVER_HOST, MONITORING_PORT)
+                await _run_until_stopped(_poll_updates(dispatcher, bot, distributor), stop)
+        logging.info("Получен сигнал остановки")
+    finally:
+        if runner is not None:
+            await runner.cleanup()
+        await stop_workers(processes, queues)
+        await bot.session.close()
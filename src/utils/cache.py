@@ -0,0 +1,97 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+class LRUCache:
+    """Потокобезопасный LRU кэш с ограничением размера и временем жизни записей.
+
+    Помимо количества записей можно ограничить их суммарный вес
+    (например, размер в байтах): weigher возвращает вес значения,
+    max_weight - допустимую сумму.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = None,
+                 max_weight: Optional[int] = None, weigher: Optional[Callable[[Any], int]] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_weight = max_weight
+        self.weigher = weigher
+        self.weight = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _pop(self, key: Hashable) -> None:
+        item = self._data.pop(key, None)
+        if item is not None:
+            self.weight -= item[2]
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Получение значения; просроченные записи удаляются."""
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                value, expires_at, _ = item
+                if expires_at is None or expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                self._pop(key)
+            self.misses += 1
+            return default
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """Сохранение значения с вытеснением самых старых записей."""
+        now = time.monotonic()
+        expires_at = now + self.ttl if self.ttl else None
+        weight = self.weigher(value) if self.weigher else 0
+        if self.max_weight is not None and weight > self.max_weight:
+            # Значение не помещается в кэш целиком
+            self.invalidate(key)
+            return
+        with self._lock:
+            self._pop(key)
+            self._data[key] = (value, expires_at, weight)
+            self.weight += weight
+            # Давно не использованные просроченные записи удаляются сразу
+            while self._data:
+                oldest_key, (_, oldest_expires_at, _) = next(iter(self._data.items()))
+                if oldest_expires_at is None or oldest_expires_at > now:
+                    break
+                self._pop(oldest_key)
+            while len(self._data) > self.maxsize or (
+                self.max_weight is not None and self.weight > self.max_weight
+            ):
+                self._pop(next(iter(self._data)))
+                self.evictions += 1
+
+    def invalidate(self, key: Hashable) -> None:
+        """Удаление записи из кэша."""
+        with self._lock:
+            self._pop(key)
+
+    def clear(self) -> None:
+        """Очистка кэша."""
+        with self._lock:
+            self._data.clear()
+            self.weight = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        """Статистика попаданий и промахов для подбора размера кэша."""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "weight": self.weight,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / total if total else 0.0
+            }
@@ -0,0 +1,62 @@
+import asyncio
+from typing import Any, Awaitable, Callable
+
+class HedgeBudget:
+    """Ограничение доли дублирующих запросов.
+
+    Каждый запрос добавляет ratio токенов (но не больше burst),
+    дублирующий запрос расходует один токен. Поэтому дублей в среднем
+    не больше ratio от общего числа запросов.
+    """
+
+    def __init__(self, ratio: float, burst: float = 10.0):
+        self.ratio = ratio
+        self.burst = burst
+        self.tokens = 0.0
+        self.requests = 0
+        self.hedges = 0
+
+    def on_request(self) -> None:
+        self.requests += 1
+        self.tokens = min(self.burst, self.tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        self.hedges += 1
+        return True
+
+async def hedged(
+    func: Callable[..., Awaitable[Any]],
+    *args,
+    delay: float,
+    budget: HedgeBudget,
+    is_success: Callable[[Any], bool] = lambda result: True
+) -> Any:
+    """Выполнение func(*args) с дублирующим запросом.
+
+    Если за delay секунд ответа нет и бюджет позволяет, запускается второй
+    такой же вызов. Возвращается первый успешный результат, оставшийся
+    вызов отменяется. Если оба вызова неуспешны, возвращается результат
+    (или исключение) последнего завершившегося. Запросы учитываются
+    в бюджете вызывающей стороной (budget.on_request).
+    """
+    primary = asyncio.ensure_future(func(*args))
+    pending = {primary}
+    try:
+        done, pending = await asyncio.wait(pending, timeout=delay)
+        if done or not budget.try_spend():
+            return await primary
+
+        pending.add(asyncio.ensure_future(func(*args)))
+        while True:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None and is_success(task.result()):
+                    return task.result()
+            if not pending:
+                return done.pop().result()
+    finally:
+        for task in pending:
+            task.cancel()
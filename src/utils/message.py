@@ -1,6 +1,13 @@
 import logging
+import time
+from typing import AsyncIterator, Optional
 from aiogram import types
-from aiogram.exceptions import TelegramBadRequest
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+
+from config.config import STREAM_EDIT_INTERVAL
+
+# Максимальная длина текста сообщения в Telegram
+MESSAGE_MAX_LENGTH = 4096
 
 async def safe_edit_message(message: types.Message, text: str, reply_markup=None):
     """Безопасное редактирование сообщения с обработкой ошибок."""
@@ -22,4 +29,62 @@ async def safe_edit_message(message: types.Message, text: str, reply_markup=None
             await message.answer(text, reply_markup=reply_markup)
     except Exception as e:
         logging.error(f"Error editing message: {e}")
-        await message.answer(text, reply_markup=reply_markup) 
\ No newline at end of file
+        await message.answer(text, reply_markup=reply_markup)
+
+async def stream_to_message(
+    message: types.Message,
+    chunks: AsyncIterator[str],
+    prefix: str = "",
+    interval: float = STREAM_EDIT_INTERVAL
+) -> Optional[str]:
+    """Постепенно обновляет сообщение по мере получения текста.
+
+    Редактирования выполняются не чаще одного раза в interval секунд,
+    чтобы не упираться в ограничения Telegram. Возвращает итоговый текст.
+    """
+    text = None
+    shown = None
+    next_edit_at = 0.0
+    async for text in chunks:
+        now = time.monotonic()
+        if now < next_edit_at or text == shown:
+            continue
+        try:
+            await message.edit_text((prefix + text)[:MESSAGE_MAX_LENGTH - 2] + " ▌")
+            shown = text
+            next_edit_at = now + interval
+        except TelegramRetryAfter as e:
+            next_edit_at = now + e.retry_after
+        except TelegramBadRequest:
+            # Незавершенная разметка в промежуточном тексте - ждем следующий фрагмент
+            next_edit_at = now + interval
+    return text
+
+def queue_position_updater(message: types.Message, text: str, interval: float = STREAM_EDIT_INTERVAL):
+    """Обработчик позиции в очереди, показывающий ее в статусном сообщении.
+
+    Позиция 0 означает, что запрос вышел из очереди: возвращается исходный
+    текст и дальнейшие обновления игнорируются.
+    """
+    state = {"admitted": False, "next_edit_at": 0.0}
+
+    async def on_queue(position: int) -> None:
+        if state["admitted"]:
+            return
+        now = time.monotonic()
+        if position == 0:
+            state["admitted"] = True
+            new_text = text
+        elif now < state["next_edit_at"]:
+            return
+        else:
+            new_text = f"{text}\n⏳ Запрос в очереди, позиция: {position}"
+        try:
+            await message.edit_text(new_text)
+            state["next_edit_at"] = now + interval
+        except TelegramRetryAfter as e:
+            state["next_edit_at"] = now + e.retry_after
+        except TelegramBadRequest:
+            pass
+
+    return on_queue
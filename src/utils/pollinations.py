@@ -1,32 +1,154 @@
-import aiohttp
+import asyncio
 import base64
+import json
 import mimetypes
+import random
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
 from urllib.parse import quote_plus
-from config.config import TEXT_MODELS_URL, IMAGE_MODELS_URL, TEXT_GENERATION_OPENAI_URL, IMAGE_GENERATION_BASE_URL
+import aiohttp
+from config.config import (
+    TEXT_MODELS_URL, IMAGE_MODELS_URL, TEXT_GENERATION_OPENAI_URL, IMAGE_GENERATION_BASE_URL, IMAGE_MAX_BYTES,
+    UPSTREAM_MAX_RETRIES, UPSTREAM_RETRY_BASE_DELAY, UPSTREAM_RETRY_MAX_DELAY, HTTP_CONNECT_TIMEOUT,
+    TEXT_HEDGING, TEXT_HEDGE_PERCENTILE, TEXT_HEDGE_BUDGET, TEXT_HEDGE_MIN_SAMPLES
+)
 import logging
 from src.managers.chat_manager import chat_manager
+from src.managers.http_client import http_client
+from src.managers.media_cache import media_cache
+from src.managers.upstream_scheduler import upstream_scheduler
+from src.managers.circuit_breaker import circuit_breakers, CircuitOpenError
+from src.managers.latency_tracker import latency_tracker
+from src.utils.single_flight import SingleFlight
+from src.utils.hedging import HedgeBudget, hedged
+
+# Последние полученные каталоги и их валидаторы для условных запросов
+_catalog_responses = {}
+_catalog_flight = SingleFlight()
+# Одновременные одинаковые генерации без состояния
+_generation_flight = SingleFlight()
+# Доля дублирующих запросов генерации текста
+_hedge_budget = HedgeBudget(TEXT_HEDGE_BUDGET)
+# Временные ошибки API, после которых запрос повторяется
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+def _retry_delay(attempt: int, retry_after: Optional[str] = None) -> Optional[float]:
+    """Задержка перед повтором: Retry-After или экспоненциальная с разбросом.
+
+    Если API просит подождать дольше UPSTREAM_RETRY_MAX_DELAY, возвращается
+    None: повторять раньше срока бесполезно.
+    """
+    if retry_after:
+        try:
+            delay = max(float(retry_after), 0.0)
+        except ValueError:
+            delay = None
+        if delay is not None:
+            return delay if delay <= UPSTREAM_RETRY_MAX_DELAY else None
+    return random.uniform(0, min(UPSTREAM_RETRY_MAX_DELAY, UPSTREAM_RETRY_BASE_DELAY * 2 ** attempt))
+
+@asynccontextmanager
+async def _upstream_request(endpoint: str, model_name: str, method: str, url: str, **kwargs):
+    """Запрос к API с очередью, повторами и размыкателем.
+
+    Ответы 429/5xx и сетевые ошибки повторяются до UPSTREAM_MAX_RETRIES раз;
+    на время задержки место в очереди освобождается. Размыкатель учитывает
+    итог запроса после всех повторов, ответ 429 ошибкой API не считается.
+    Пока размыкатель модели открыт, сразу выбрасывается CircuitOpenError.
+    Время каждого запроса учитывается в latency_tracker, таймаут подбирается
+    по времени ответа модели.
+    """
+    breaker = circuit_breakers.get(endpoint, model_name)
+    breaker.check()
+    session = await http_client.get_session()
+    for attempt in range(UPSTREAM_MAX_RETRIES + 1):
+        yielded = False
+        timeout = latency_tracker.timeout(endpoint, model_name)
+        # Таймаут запроса заменяет таймаут сессии целиком, поэтому ограничение
+        # на подключение задается повторно
+        request_timeout = aiohttp.ClientTimeout(total=timeout, connect=HTTP_CONNECT_TIMEOUT)
+        async with upstream_scheduler.slot(endpoint):
+            try:
+                started = time.monotonic()
+                async with session.request(method, url, timeout=request_timeout, **kwargs) as response:
+                    delay = None
+                    if response.status in RETRY_STATUSES and attempt < UPSTREAM_MAX_RETRIES:
+                        delay = _retry_delay(attempt, response.headers.get("Retry-After"))
+                    if delay is None:
+                        if response.status not in RETRY_STATUSES:
+                            breaker.record_success()
+                        elif response.status != 429:
+                            breaker.record_failure()
+                        yielded = True
+                        yield response
+                        if response.status == 200:
+                            latency_tracker.record(endpoint, model_name, time.monotonic() - started)
+                        return
+                    logging.warning(f"API вернул {response.status} ({endpoint}:{model_name}), повтор через {delay:.1f} с")
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if isinstance(e, asyncio.TimeoutError):
+                    latency_tracker.record_timeout(endpoint, model_name, timeout)
+                if yielded:
+                    raise
+                if attempt == UPSTREAM_MAX_RETRIES:
+                    breaker.record_failure()
+                    raise
+                delay = _retry_delay(attempt)
+                logging.warning(f"Ошибка запроса к API ({endpoint}:{model_name}): {e!r}, повтор через {delay:.1f} с")
+        await asyncio.sleep(delay)
 
 async def fetch_models(url: str) -> list:
-    """Асинхронно получает список моделей с указанного URL."""
+    """Асинхронно получает список моделей с указанного URL.
+
+    Повторные запросы отправляются с If-None-Match / If-Modified-Since,
+    и при ответе 304 возвращается ранее полученный список.
+    """
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as response:
-                if response.status == 200:
-                    return await response.json()
-                return None
+        cached = _catalog_responses.get(url)
+        headers = {}
+        if cached:
+            if cached.get("etag"):
+                headers["If-None-Match"] = cached["etag"]
+            if cached.get("last_modified"):
+                headers["If-Modified-Since"] = cached["last_modified"]
+
+        session = await http_client.get_session()
+        async with session.get(url, headers=headers) as response:
+            if response.status == 304 and cached:
+                return cached["data"]
+            if response.status == 200:
+                data = await response.json()
+                _catalog_responses[url] = {
+                    "etag": response.headers.get("ETag"),
+                    "last_modified": response.headers.get("Last-Modified"),
+                    "data": data
+                }
+                return data
+            return None
     except Exception as e:
         print(f"Ошибка при запросе моделей: {e}")
         return None
 
-async def fetch_all_models():
-    """Получает списки всех доступных моделей."""
-    text_models = await fetch_models(TEXT_MODELS_URL)
-    image_models = await fetch_models(IMAGE_MODELS_URL)
-    audio_models = await fetch_models(TEXT_MODELS_URL) # Аудио модели тоже доступны через TEXT_MODELS_URL
-    if audio_models:
-        audio_models = [model for model in audio_models if model.get("name") == "openai-audio"]
+async def _fetch_all_models():
+    # Каждый URL запрашивается один раз, разные URL - параллельно
+    text_models, image_models = await asyncio.gather(
+        fetch_models(TEXT_MODELS_URL),
+        fetch_models(IMAGE_MODELS_URL)
+    )
+    # Аудио модели доступны через TEXT_MODELS_URL
+    audio_models = None
+    if text_models:
+        audio_models = [model for model in text_models if model.get("name") == "openai-audio"]
     return text_models, image_models, audio_models
 
+async def fetch_all_models():
+    """Получает списки всех доступных моделей.
+
+    Одновременные вызовы ожидают один и тот же запрос.
+    """
+    return await _catalog_flight.run("all_models", _fetch_all_models)
+
 async def encode_image_to_base64(image_bytes: bytes) -> tuple:
     """Кодирует изображение в base64 строку и определяет MIME-тип."""
     try:
@@ -42,68 +164,190 @@ async def encode_image_to_base64(image_bytes: bytes) -> tuple:
         print(f"Ошибка при кодировании изображения: {e}")
         return None, None
 
-async def generate_text(model_name: str, prompt: str, image_data: bytes = None, user_id: int = None) -> str:
-    """Генерирует текст с использованием выбранной модели."""
-    try:
-        messages = []
-        
-        # Получаем историю чата, если указан user_id
-        if user_id:
-            chat_history = await chat_manager.get_context(user_id)
-            messages.extend(chat_history)
-        
-        if image_data:
-            image_base64, mime_type = await encode_image_to_base64(image_data)
-            if image_base64 and mime_type:
-                # Формируем специальный промпт для Pollinations API с изображением
-                image_prompt = f"Analyze this image and answer the following question: {prompt}"
-                messages.append({
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": image_prompt},
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:{mime_type};base64,{image_base64}",
-                                "detail": "high"  # Запрашиваем высокое качество анализа изображения
-                            }
+async def _build_text_payload(model_name: str, prompt: str, image_data: bytes = None, user_id: int = None) -> dict:
+    """Формирует запрос к OpenAI-совместимому API с историей чата и изображением."""
+    messages = []
+    
+    # Получаем историю чата, если указан user_id
+    if user_id:
+        chat_history = await chat_manager.get_context(user_id)
+        messages.extend(chat_history)
+    
+    if image_data:
+        image_base64, mime_type = await encode_image_to_base64(image_data)
+        if image_base64 and mime_type:
+            # Формируем специальный промпт для Pollinations API с изображением
+            image_prompt = f"Analyze this image and answer the following question: {prompt}"
+            messages.append({
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": image_prompt},
+                    {
+                        "type": "image_url",
+                        "image_url": {
+                            "url": f"data:{mime_type};base64,{image_base64}",
+                            "detail": "high"  # Запрашиваем высокое качество анализа изображения
                         }
-                    ]
-                })
-            else:
-                messages.append({"role": "user", "content": prompt})
+                    }
+                ]
+            })
         else:
             messages.append({"role": "user", "content": prompt})
+    else:
+        messages.append({"role": "user", "content": prompt})
 
-        payload = {
-            "model": model_name,
-            "messages": messages,
-            "max_tokens": 1000,  # Увеличиваем лимит токенов для более подробных ответов
-            "temperature": 0.7,  # Добавляем немного креативности в ответы
-            "presence_penalty": 0.6,  # Поощряем разнообразие в ответах
-            "frequency_penalty": 0.3  # Уменьшаем повторения
-        }
+    return {
+        "model": model_name,
+        "messages": messages,
+        "max_tokens": 1000,  # Увеличиваем лимит токенов для более подробных ответов
+        "temperature": 0.7,  # Добавляем немного креативности в ответы
+        "presence_penalty": 0.6,  # Поощряем разнообразие в ответах
+        "frequency_penalty": 0.3  # Уменьшаем повторения
+    }
+
+def _normalize_prompt(prompt: str) -> str:
+    """Нормализует промпт для объединения одинаковых запросов."""
+    return " ".join(prompt.split())
+
+def text_flight_key(model_name: str, prompt: str) -> tuple:
+    """Ключ объединения одинаковых запросов генерации текста."""
+    return ("text", model_name, _normalize_prompt(prompt))
+
+async def _request_text(payload: dict) -> tuple:
+    """Отправляет запрос генерации текста. Возвращает (ответ, текст ошибки)."""
+    async with _upstream_request("text", payload["model"], "POST", TEXT_GENERATION_OPENAI_URL, json=payload) as response:
+        if response.status == 200:
+            result = await response.json()
+            if result.get("choices") and len(result["choices"]) > 0:
+                content = result["choices"][0].get("message", {}).get("content")
+                if content:
+                    return content, None
+                return None, "Модель вернула пустой ответ"
+        return None, f"Ошибка при генерации текста. Статус: {response.status}"
+
+async def _request_text_hedged(payload: dict) -> tuple:
+    """Запрос генерации текста с дублированием медленных запросов (TEXT_HEDGING).
+
+    Используется только непотоковой генерацией; generate_text_stream запросы не дублирует.
+    """
+    if not TEXT_HEDGING:
+        return await _request_text(payload)
+
+    _hedge_budget.on_request()
+    model_name = payload["model"]
+    delay = None
+    if latency_tracker.count("text", model_name) >= TEXT_HEDGE_MIN_SAMPLES:
+        delay = latency_tracker.percentile("text", model_name, TEXT_HEDGE_PERCENTILE)
+    if delay is None:
+        return await _request_text(payload)
+    return await hedged(
+        _request_text, payload,
+        delay=delay,
+        budget=_hedge_budget,
+        is_success=lambda result: result[1] is None
+    )
+
+async def generate_text(model_name: str, prompt: str, image_data: bytes = None, user_id: int = None) -> str:
+    """Генерирует текст с использованием выбранной модели.
 
-        async with aiohttp.ClientSession() as session:
-            async with session.post(TEXT_GENERATION_OPENAI_URL, json=payload) as response:
-                if response.status == 200:
-                    result = await response.json()
-                    if result.get("choices") and len(result["choices"]) > 0:
-                        content = result["choices"][0].get("message", {}).get("content")
-                        if content:
-                            # Сохраняем ответ модели в историю чата
-                            if user_id:
-                                await chat_manager.add_message(user_id, prompt, role="user")
-                                await chat_manager.add_message(user_id, content, role="assistant")
-                            return content
-                        return "Модель вернула пустой ответ"
-                return f"Ошибка при генерации текста. Статус: {response.status}"
+    Одновременные одинаковые запросы без истории чата и изображения
+    объединяются в один запрос к API (в том числе от разных пользователей). При включенном TEXT_HEDGING медленный
+    запрос дублируется; в историю попадает только первый успешный ответ.
+    """
+    try:
+        payload = await _build_text_payload(model_name, prompt, image_data, user_id)
+
+        # Без истории чата запрос состоит только из промпта и не зависит от пользователя
+        if image_data is None and len(payload["messages"]) == 1:
+            content, error = await _generation_flight.run(text_flight_key(model_name, prompt), _request_text_hedged, payload)
+        else:
+            content, error = await _request_text_hedged(payload)
+        if error:
+            return error
+
+        # Сохраняем ответ модели в историю чата
+        if user_id:
+            await chat_manager.add_message(user_id, prompt, role="user")
+            await chat_manager.add_message(user_id, content, role="assistant")
+        return content
+    except CircuitOpenError as e:
+        return str(e)
     except Exception as e:
         logging.error(f"Ошибка при генерации текста: {str(e)}")
         return f"Произошла ошибка при обработке запроса: {str(e)}"
 
-async def generate_audio(model_name: str, prompt: str, voice: str = "alloy") -> bytes:
-    """Генерирует аудио из текста с использованием выбранной модели и голоса."""
+async def generate_text_stream(model_name: str, prompt: str, image_data: bytes = None, user_id: int = None) -> AsyncIterator[str]:
+    """Генерирует текст в потоковом режиме (SSE).
+
+    Возвращает накопленный на текущий момент текст после каждого фрагмента.
+    История чата сохраняется один раз, после завершения потока.
+    """
+    try:
+        payload = await _build_text_payload(model_name, prompt, image_data, user_id)
+        payload["stream"] = True
+
+        async with _upstream_request("text", model_name, "POST", TEXT_GENERATION_OPENAI_URL, json=payload) as response:
+            if response.status != 200:
+                yield f"Ошибка при генерации текста. Статус: {response.status}"
+                return
+
+            content = ""
+            async for raw_line in response.content:
+                line = raw_line.decode("utf-8").strip()
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                try:
+                    chunk = json.loads(data)
+                except ValueError:
+                    continue
+                choices = chunk.get("choices") or [{}]
+                delta = (choices[0].get("delta") or {}).get("content")
+                if delta:
+                    content += delta
+                    yield content
+
+        if not content:
+            yield "Модель вернула пустой ответ"
+            return
+
+        # Сохраняем ответ модели в историю чата
+        if user_id:
+            await chat_manager.add_message(user_id, prompt, role="user")
+            await chat_manager.add_message(user_id, content, role="assistant")
+    except CircuitOpenError as e:
+        yield str(e)
+    except Exception as e:
+        logging.error(f"Ошибка при потоковой генерации текста: {str(e)}")
+        yield f"Произошла ошибка при обработке запроса: {str(e)}"
+
+def image_cache_key(model_name: str, prompt: str) -> str:
+    """Ключ генерации изображения для кэшей."""
+    return media_cache.make_key("image", model_name, prompt)
+
+def audio_cache_key(model_name: str, prompt: str, voice: str = "alloy") -> str:
+    """Ключ генерации аудио для кэшей."""
+    return media_cache.make_key("audio", model_name, prompt, voice, format="mp3")
+
+async def generate_audio(model_name: str, prompt: str, voice: str = "alloy", bypass_cache: bool = False) -> bytes:
+    """Генерирует аудио из текста с использованием выбранной модели и голоса.
+
+    Результат кэшируется на диске; bypass_cache=True принудительно генерирует заново.
+    Одновременные одинаковые запросы объединяются в один запрос к API.
+    """
+    cache_key = audio_cache_key(model_name, prompt, voice)
+    if not bypass_cache:
+        cached = await media_cache.get(cache_key)
+        if cached:
+            return cached
+
+    flight_key = ("audio", model_name, _normalize_prompt(prompt), voice)
+    return await _generation_flight.run(flight_key, _request_audio, model_name, prompt, voice, cache_key)
+
+async def _request_audio(model_name: str, prompt: str, voice: str, cache_key: str) -> bytes:
+    """Отправляет запрос генерации аудио и сохраняет результат в кэш."""
     try:
         # Добавляем явное указание на озвучивание текста в промпте
         audio_prompt = f"Please convert the following text to speech: {prompt}"
@@ -117,41 +361,74 @@ async def generate_audio(model_name: str, prompt: str, voice: str = "alloy") ->
             ]
         }
 
-        async with aiohttp.ClientSession() as session:
-            async with session.post(TEXT_GENERATION_OPENAI_URL, json=payload) as response:
-                if response.status == 200:
-                    result = await response.json()
-                    # Извлекаем base64 аудиоданные
-                    audio_data_base64 = result.get("choices", [{}])[0].get("message", {}).get("audio", {}).get("data")
-                    if audio_data_base64:
-                        # Декодируем base64 в байты
-                        return base64.b64decode(audio_data_base64)
-
-                    # Если аудио данные не получены, но есть текстовый ответ, возможно, это ошибка API или модель не смогла сгенерировать аудио
-                    content = result.get("choices", [{}])[0].get("message", {}).get("content")
-                    if content:
-                         logging.warning(f"Получен текстовый ответ вместо аудио для запроса: {prompt}. Ответ: {content[:100]}...")
-                         # В этом случае возвращаем None, чтобы обработчик показал ошибку
-                         return None
-
-                    return None # f"Ошибка при генерации аудио. Статус: {response.status}"
-                logging.error(f"Ошибка API при генерации аудио. Статус: {response.status}")
-                return None
+        async with _upstream_request("audio", model_name, "POST", TEXT_GENERATION_OPENAI_URL, json=payload) as response:
+            if response.status == 200:
+                result = await response.json()
+                # Извлекаем base64 аудиоданные
+                audio_data_base64 = result.get("choices", [{}])[0].get("message", {}).get("audio", {}).get("data")
+                if audio_data_base64:
+                    # Декодируем base64 в байты
+                    audio_data = base64.b64decode(audio_data_base64)
+                    await media_cache.put(cache_key, audio_data)
+                    return audio_data
+
+                # Если аудио данные не получены, но есть текстовый ответ, возможно, это ошибка API или модель не смогла сгенерировать аудио
+                content = result.get("choices", [{}])[0].get("message", {}).get("content")
+                if content:
+                     logging.warning(f"Получен текстовый ответ вместо аудио для запроса: {prompt}. Ответ: {content[:100]}...")
+                     # В этом случае возвращаем None, чтобы обработчик показал ошибку
+                     return None
+
+                return None # f"Ошибка при генерации аудио. Статус: {response.status}"
+            logging.error(f"Ошибка API при генерации аудио. Статус: {response.status}")
+            return None
+    except CircuitOpenError as e:
+        logging.warning(str(e))
+        return None
     except Exception as e:
         logging.error(f"Ошибка при генерации аудио: {str(e)}")
         return None
 
-async def generate_image(model_name: str, prompt: str) -> str:
-    """Генерирует изображение с использованием выбранной модели."""
+async def generate_image(model_name: str, prompt: str) -> tuple:
+    """Генерирует изображение с использованием выбранной модели.
+
+    Возвращает (байты изображения, URL запроса). Если изображение больше
+    IMAGE_MAX_BYTES, байты не сохраняются и возвращается (None, URL),
+    чтобы Telegram загрузил изображение сам. При ошибке - (None, None).
+    Результат кэшируется на диске.
+    Одновременные одинаковые запросы объединяются в один запрос к API.
+    """
     try:
         encoded_prompt = quote_plus(prompt)
         request_url = f"{IMAGE_GENERATION_BASE_URL}{encoded_prompt}?model={model_name}"
+
+        cache_key = image_cache_key(model_name, prompt)
+        cached = await media_cache.get(cache_key)
+        if cached:
+            return cached, request_url
         
-        async with aiohttp.ClientSession() as session:
-            async with session.get(request_url) as response:
-                if response.status == 200:
-                    return request_url
-                return None
+        flight_key = ("image", model_name, _normalize_prompt(prompt))
+        return await _generation_flight.run(flight_key, _download_image, model_name, request_url, cache_key)
+    except CircuitOpenError as e:
+        logging.warning(str(e))
+        return None, None
     except Exception as e:
         print(f"Ошибка при генерации изображения: {e}")
-        return None 
\ No newline at end of file
+        return None, None
+
+async def _download_image(model_name: str, request_url: str, cache_key: str) -> tuple:
+    """Загружает сгенерированное изображение и сохраняет его в кэш."""
+    async with _upstream_request("image", model_name, "GET", request_url) as response:
+        if response.status != 200:
+            return None, None
+        if response.content_length and response.content_length > IMAGE_MAX_BYTES:
+            return None, request_url
+
+        image_data = bytearray()
+        async for chunk in response.content.iter_chunked(64 * 1024):
+            image_data.extend(chunk)
+            if len(image_data) > IMAGE_MAX_BYTES:
+                return None, request_url
+        image_data = bytes(image_data)
+        await media_cache.put(cache_key, image_data)
+        return image_data, request_url
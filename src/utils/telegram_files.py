@@ -0,0 +1,78 @@
+import logging
+from typing import Awaitable, Callable, Optional, Tuple, Union
+from aiogram import Bot, types
+from aiogram.exceptions import TelegramAPIError, TelegramBadRequest
+from aiogram.types import InputFile
+
+from config.config import PHOTO_CACHE_SIZE, PHOTO_CACHE_MAX_BYTES, PHOTO_CACHE_TTL
+from src.managers.async_database import async_db
+from src.utils.cache import LRUCache
+
+Media = Union[str, InputFile]
+
+# Недавно загруженные фотографии пользователей по file_id. В состоянии FSM
+# хранится только file_id, байты при промахе загружаются из Telegram заново
+photo_cache = LRUCache(
+    maxsize=PHOTO_CACHE_SIZE,
+    ttl=PHOTO_CACHE_TTL,
+    max_weight=PHOTO_CACHE_MAX_BYTES,
+    weigher=len
+)
+
+async def download_photo(bot: Bot, file_id: str) -> Optional[bytes]:
+    """Получение байтов фотографии из кэша или из Telegram."""
+    data = photo_cache.get(file_id)
+    if data is not None:
+        return data
+    try:
+        data = (await bot.download(file_id)).read()
+    except TelegramAPIError as e:
+        logging.error(f"Ошибка при загрузке фото {file_id}: {e}")
+        return None
+    photo_cache.set(file_id, data)
+    return data
+
+def get_sent_file(message: types.Message) -> Optional[Tuple[str, str]]:
+    """Получение file_id и типа медиа файла из отправленного сообщения."""
+    if message.photo:
+        return message.photo[-1].file_id, "photo"
+    if message.audio:
+        return message.audio.file_id, "audio"
+    if message.document:
+        return message.document.file_id, "document"
+    return None
+
+async def answer_with_file_cache(
+    cache_key: str,
+    send: Callable[[Media, Optional[str]], Awaitable[types.Message]],
+    generate: Callable[[], Awaitable[Optional[Media]]],
+    bypass_cache: bool = False
+) -> Optional[types.Message]:
+    """Отправка медиа с повторным использованием file_id.
+
+    Если файл с таким ключом уже загружался в Telegram, отправляется его
+    file_id без повторной загрузки: send(file_id, тип медиа) должен
+    использовать метод этого типа (например, документ вместо фото).
+    Иначе файл генерируется и отправляется через send(файл, None), а его
+    file_id сохраняется. bypass_cache=True пропускает поиск file_id.
+    Возвращает отправленное сообщение или None.
+    """
+    if not bypass_cache:
+        cached = await async_db.get_telegram_file(cache_key)
+        if cached:
+            file_id, media_type = cached
+            try:
+                return await send(file_id, media_type)
+            except TelegramBadRequest:
+                # file_id больше недействителен - загружаем файл заново
+                await async_db.delete_telegram_file(cache_key)
+
+    media = await generate()
+    if media is None:
+        return None
+
+    sent = await send(media, None)
+    sent_file = get_sent_file(sent)
+    if sent_file:
+        await async_db.save_telegram_file(cache_key, *sent_file)
+    return sent
@@ -0,0 +1,40 @@
+import logging
+from typing import Callable, Optional
+
+from config.config import TOKENIZER_ENCODING
+
+Tokenizer = Callable[[str], int]
+
+def approximate_tokens(text: str) -> int:
+    """Примерная оценка токенов (4 символа ~ 1 токен)."""
+    return len(text) // 4
+
+_tokenizer: Tokenizer = approximate_tokens
+
+def set_tokenizer(tokenizer: Tokenizer) -> None:
+    """Установка функции подсчета токенов.
+
+    Уже сохраненные в базе значения не пересчитываются.
+    """
+    global _tokenizer
+    _tokenizer = tokenizer
+
+def count_tokens(text: str) -> int:
+    """Подсчет токенов в тексте текущим токенизатором."""
+    return _tokenizer(text or "")
+
+def _load_tiktoken(encoding_name: str) -> Optional[Tokenizer]:
+    """Создание токенизатора на основе tiktoken, если он установлен."""
+    try:
+        import tiktoken
+    except ImportError:
+        logging.warning("tiktoken не установлен, используется примерная оценка токенов")
+        return None
+
+    encoding = tiktoken.get_encoding(encoding_name)
+    return lambda text: len(encoding.encode(text, disallowed_special=()))
+
+if TOKENIZER_ENCODING:
+    tiktoken_tokenizer = _load_tiktoken(TOKENIZER_ENCODING)
+    if tiktoken_tokenizer:
+        set_tokenizer(tiktoken_tokenizer)
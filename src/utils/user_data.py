@@ -1,20 +1,29 @@
 from typing import Dict, Any
-from src.managers.database import db
+from src.managers.async_database import async_db
+from src.managers.usage_counter import usage_counter
 
 # Хранилище данных пользователей
 user_data = {}
 
-def get_user_stats(user_id: int) -> dict:
+async def get_user_stats(user_id: int) -> dict:
     """Получение статистики пользователя."""
-    return db.get_user_stats(user_id)
+    return await usage_counter.get_user_stats(user_id)
 
-def update_user_stats(user_id: int, stats: Dict[str, Any]) -> None:
-    """Обновление статистики пользователя."""
-    db.update_user_stats(user_id, stats)
+async def update_user_stats(user_id: int, stats: Dict[str, Any]) -> None:
+    """Обновление настроек пользователя."""
+    await async_db.update_user_stats(user_id, stats)
 
-def get_menu_text(user_id: int) -> str:
+def get_user_cache_stats() -> Dict[str, Any]:
+    """Статистика кэша профилей пользователей (попадания, промахи, размер)."""
+    return async_db.db.user_cache.stats()
+
+def increment_usage(user_id: int, counter: str) -> None:
+    """Увеличение счетчика генераций пользователя (с отложенной записью)."""
+    usage_counter.increment(user_id, counter)
+
+async def get_menu_text(user_id: int) -> str:
     """Получает текст для главного меню с информацией о пользователе."""
-    stats = get_user_stats(user_id)
+    stats = await get_user_stats(user_id)
     
     # Получаем информацию о текущей модели
     current_model = stats.get("current_model", "Не выбрана")